@@ -0,0 +1,135 @@
+"""
+Guards the cold start of the entry points, which every Fargate task pays: each
+entry point is imported in a fresh interpreter with -X importtime, without a
+config in the environment. Fails when an import takes longer than its budget,
+has side effects that need the config, or pulls in a heavy module that its stage
+only needs later, if at all.
+
+    python benchmark/check_import_time.py --repeat 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+FAKES_DIR = os.path.join(BENCHMARK_DIR, "fakes")
+
+# Imported on first use: SageMaker on a cache miss, sumy in the summary workers,
+# redis on the first call through a shared rate limiter
+LAZY_MODULES = [
+    "sagemaker",
+    "common_tools.sagemaker_inference",
+    "sumy",
+    "nltk",
+    "redis",
+]
+FETCH_ONLY_MODULES = ["praw", "googleapiclient"]
+DB_ONLY_MODULES = ["sqlalchemy"]
+
+# Budgets of the cumulative import time, in milliseconds
+ENTRY_POINTS = {
+    "reddit_signals": {
+        "entry_get_subreddit_data": (1500, LAZY_MODULES + DB_ONLY_MODULES),
+        "entry_get_subreddits_data": (1500, LAZY_MODULES + DB_ONLY_MODULES),
+        "entry_get_combined_data": (1000, LAZY_MODULES + FETCH_ONLY_MODULES),
+        "entry_write_to_db": (2000, LAZY_MODULES),
+        "entry_migrate_db": (1000, LAZY_MODULES + FETCH_ONLY_MODULES),
+    },
+    "youtube_signals": {
+        "entry_get_video_category_data": (1500, LAZY_MODULES + DB_ONLY_MODULES),
+        "entry_get_video_categories_data": (1500, LAZY_MODULES + DB_ONLY_MODULES),
+        "entry_get_combined_data": (1000, LAZY_MODULES + FETCH_ONLY_MODULES),
+        "entry_write_to_db": (2000, LAZY_MODULES),
+        "entry_migrate_db": (1000, LAZY_MODULES + FETCH_ONLY_MODULES),
+    },
+}
+
+
+def get_import_times(package, module_name):
+    """
+    Imports module_name in a fresh interpreter and returns the cumulative import
+    time of every imported module, in milliseconds, keyed by module name.
+    """
+    src_dir = os.path.join(REPO_DIR, package, "src")
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in ("config", "execution_date")
+    }
+    # The common_tools submodule is used when checked out, the fakes otherwise
+    env["PYTHONPATH"] = os.pathsep.join([src_dir, FAKES_DIR])
+
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        cwd=src_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+
+    import_times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        import_times[name.strip()] = int(cumulative) / 1000
+
+    return import_times
+
+
+def get_loaded_modules(import_times, module_names):
+    return sorted(
+        name
+        for name in import_times
+        for module_name in module_names
+        if name == module_name or name.startswith(f"{module_name}.")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="The fastest of the imports is kept"
+    )
+    parser.add_argument(
+        "--budget-scale",
+        type=float,
+        default=1.0,
+        help="Multiplies the budgets, e.g. for slower machines",
+    )
+    args = parser.parse_args()
+
+    failures = []
+    for package, entry_points in ENTRY_POINTS.items():
+        for module_name, (budget_ms, unexpected_modules) in entry_points.items():
+            name = f"{package}/{module_name}"
+            try:
+                runs = [
+                    get_import_times(package, module_name) for _ in range(args.repeat)
+                ]
+            except RuntimeError as e:
+                failures.append(f"{name} couldn't be imported: {e}")
+                continue
+
+            import_ms = min(run[module_name] for run in runs)
+            budget_ms = budget_ms * args.budget_scale
+            print(f"{name:<55} {import_ms:>8.1f} ms (budget {budget_ms:.0f} ms)")
+
+            if import_ms > budget_ms:
+                failures.append(f"{name} took {import_ms:.1f} ms to import")
+
+            loaded_modules = get_loaded_modules(runs[0], unexpected_modules)
+            if loaded_modules:
+                failures.append(f"{name} imported {', '.join(loaded_modules)}")
+
+    if failures:
+        print("\n" + "\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
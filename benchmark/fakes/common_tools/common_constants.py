@@ -0,0 +1,15 @@
+# Stand-in values for offline runs; the real ones live in the common_tools submodule
+CATEGORIES = ["Organization", "Person", "Location"]
+SUB_CATEGORIES = [
+    "Politics",
+    "Business",
+    "Technology",
+    "Entertainment",
+    "Sports",
+    "Miscellaneous",
+]
+NONE_FILLER = "None"
+CLASSIFICATION_THRESHOLD = 0.5
+
+SCHEMA = None
+TABLE_NAME = "social_signals"
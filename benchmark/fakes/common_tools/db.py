@@ -0,0 +1,5 @@
+import os
+
+
+def get_engine():
+    return os.environ.get("BENCHMARK_DB_URL", "sqlite:///benchmark.sqlite")
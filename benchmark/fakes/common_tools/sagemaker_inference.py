@@ -0,0 +1,61 @@
+import hashlib
+import os
+import time
+
+from common_tools.common_constants import SUB_CATEGORIES
+
+# Simulated round trip to an endpoint
+INFERENCE_LATENCY_SECONDS = (
+    float(os.environ.get("BENCHMARK_INFERENCE_LATENCY_MS", 50)) / 1000
+)
+
+ENTITY_GROUPS = ["ORG", "PER", "LOC"]
+EMOTIONS = ["neutral", "joy", "surprise", "anger", "sadness"]
+
+
+def get_text_hash(text):
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest(), 16)
+
+
+def get_ner(text):
+    # Capitalized words are the entities; their group is derived from the word
+    time.sleep(INFERENCE_LATENCY_SECONDS)
+
+    entities, start = [], 0
+    for word in text.split():
+        start = text.index(word, start)
+        if word[:1].isupper() and len(word) > 1:
+            entities.append(
+                {
+                    "entity_group": ENTITY_GROUPS[get_text_hash(word) % 3],
+                    "score": 0.9,
+                    "word": word,
+                    "start": start,
+                    "end": start + len(word),
+                }
+            )
+        start += len(word)
+
+    return entities
+
+
+def get_categories(text):
+    time.sleep(INFERENCE_LATENCY_SECONDS)
+
+    offset = get_text_hash(text) % len(SUB_CATEGORIES)
+    labels = SUB_CATEGORIES[offset:] + SUB_CATEGORIES[:offset]
+    scores = [0.6] + [0.4 / (len(labels) - 1)] * (len(labels) - 1)
+
+    return {"sequence": text, "labels": labels, "scores": scores}
+
+
+def get_emotion(text):
+    time.sleep(INFERENCE_LATENCY_SECONDS)
+
+    text_hash = get_text_hash(text)
+    return [
+        {
+            "label": EMOTIONS[text_hash % len(EMOTIONS)],
+            "score": 0.4 + text_hash % 60 / 100,
+        }
+    ]
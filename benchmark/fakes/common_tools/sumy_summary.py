@@ -0,0 +1,16 @@
+import os
+import time
+
+# Simulated CPU time of one summary job
+SUMMARY_LATENCY_SECONDS = (
+    float(os.environ.get("BENCHMARK_SUMMARY_LATENCY_MS", 200)) / 1000
+)
+
+
+def get_sumy_summary(comments):
+    # Busy wait, as the real summarizer holds the CPU rather than sleeping
+    deadline = time.perf_counter() + SUMMARY_LATENCY_SECONDS
+    while time.perf_counter() < deadline:
+        pass
+
+    return " ".join(comments[:2])
@@ -0,0 +1,368 @@
+"""
+Stand-ins for the Reddit and YouTube APIs. Responses have the shape of the real
+ones and are generated deterministically from a seed, so that runs with the same
+parameters see the same listings, titles and comments.
+"""
+import json
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+WORDS = [
+    "announces",
+    "plan",
+    "after",
+    "talks",
+    "record",
+    "deal",
+    "report",
+    "market",
+    "vote",
+    "new",
+    "season",
+    "launch",
+    "warning",
+    "growth",
+    "court",
+    "ruling",
+    "release",
+    "strike",
+    "price",
+    "update",
+]
+NAMES = [
+    "Acme",
+    "Globex",
+    "Initech",
+    "Umbrella",
+    "Alice",
+    "Bob",
+    "Carol",
+    "Dave",
+    "Paris",
+    "Berlin",
+    "Tokyo",
+    "Lagos",
+]
+# Share of titles with at least one entity
+ENTITY_TITLE_RATIO = 0.7
+# Share of comments written by bots or stickied by mods
+FILTERED_COMMENT_RATIO = 0.1
+
+
+def get_title(rng):
+    words = rng.sample(WORDS, 6)
+    if rng.random() < ENTITY_TITLE_RATIO:
+        for name in rng.sample(NAMES, rng.randint(1, 2)):
+            words.insert(rng.randint(0, len(words)), name)
+
+    return " ".join(words)
+
+
+def get_comment(rng):
+    sentences = [
+        " ".join(rng.sample(WORDS, rng.randint(4, 10))).capitalize()
+        for _ in range(rng.randint(1, 3))
+    ]
+    return ". ".join(sentences) + rng.choice([".", "!", "?"])
+
+
+class RedditResponder(BaseAdapter):
+    """
+    Transport adapter answering the Reddit API calls made by praw: OAuth token,
+    subreddit top listing, submission comments and "load more comments".
+    """
+
+    def __init__(self, submissions_count, comments_count, latency_seconds, seed=0):
+        super().__init__()
+        self.submissions_count = submissions_count
+        self.comments_count = comments_count
+        self.latency_seconds = latency_seconds
+        self.seed = seed
+
+    def get_submissions(self, subreddit_name):
+        rng = random.Random(f"{self.seed}-{subreddit_name}")
+
+        submissions = []
+        for i in range(self.submissions_count):
+            submission_id = f"{subreddit_name[:3]}{i:05d}".lower()
+            score = rng.randint(10, 50000)
+            submissions.append(
+                {
+                    "id": submission_id,
+                    "name": f"t3_{submission_id}",
+                    "title": get_title(rng),
+                    "subreddit": subreddit_name,
+                    "author": f"user{rng.randint(0, 9999)}",
+                    "score": score,
+                    "upvote_ratio": round(rng.uniform(0.5, 1.0), 2),
+                    "num_comments": rng.randint(0, score // 10 + 1),
+                    "stickied": False,
+                    "created_utc": time.time() - rng.randint(0, 86400),
+                    "permalink": f"/r/{subreddit_name}/comments/{submission_id}/",
+                }
+            )
+
+        return submissions
+
+    def get_comments(self, submission_id):
+        rng = random.Random(f"{self.seed}-{submission_id}")
+
+        comments = []
+        for i in range(self.comments_count):
+            filtered = rng.random() < FILTERED_COMMENT_RATIO
+            comment_id = f"{submission_id}c{i:04d}"
+            comments.append(
+                {
+                    "id": comment_id,
+                    "name": f"t1_{comment_id}",
+                    "body": get_comment(rng),
+                    "author": "AutoModerator_bot" if filtered else f"user{i}",
+                    "stickied": filtered and i == 0,
+                    "parent_id": f"t3_{submission_id}",
+                    "link_id": f"t3_{submission_id}",
+                    "score": rng.randint(0, 1000),
+                    "depth": 0,
+                    "replies": "",
+                }
+            )
+
+        return comments
+
+    def get_top_listing(self, subreddit_name, limit):
+        submissions = self.get_submissions(subreddit_name)[:limit]
+        return get_listing([("t3", submission) for submission in submissions])
+
+    def get_submission_comments(self, submission_id, limit):
+        comments = self.get_comments(submission_id)
+        children = [("t1", comment) for comment in comments[:limit]]
+        if len(comments) > limit:
+            more_ids = [comment["id"] for comment in comments[limit:]]
+            more = {
+                "count": len(more_ids),
+                "name": f"t1_{more_ids[0]}",
+                "id": more_ids[0],
+                "parent_id": f"t3_{submission_id}",
+                "depth": 0,
+                "children": more_ids,
+            }
+            children.append(("more", more))
+
+        submission = {"id": submission_id, "name": f"t3_{submission_id}"}
+        return [get_listing([("t3", submission)]), get_listing(children)]
+
+    def get_more_children(self, link_id, children):
+        submission_id = link_id.split("_", 1)[1]
+        ids = set(children.split(","))
+        things = [
+            {"kind": "t1", "data": comment}
+            for comment in self.get_comments(submission_id)
+            if comment["id"] in ids
+        ]
+
+        return {"json": {"errors": [], "data": {"things": things}}}
+
+    def get_data(self, request):
+        url = urlparse(request.url)
+        path = url.path.rstrip("/")
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if path.endswith("/api/v1/access_token"):
+            return {
+                "access_token": "benchmark",
+                "expires_in": 86400,
+                "scope": "*",
+                "token_type": "bearer",
+            }
+
+        match = re.fullmatch(r"/r/([^/]+)/top", path)
+        if match:
+            return self.get_top_listing(match.group(1), int(params.get("limit", 100)))
+
+        match = re.fullmatch(r"/comments/([^/]+)", path)
+        if match:
+            return self.get_submission_comments(
+                match.group(1), int(params.get("limit", 100))
+            )
+
+        if path == "/api/morechildren":
+            body = request.body
+            if isinstance(body, bytes):
+                body = body.decode("utf-8")
+            form = {key: values[0] for key, values in parse_qs(body).items()}
+            return self.get_more_children(form["link_id"], form["children"])
+
+    def send(self, request, **kwargs):
+        time.sleep(self.latency_seconds)
+
+        data = self.get_data(request)
+
+        response = Response()
+        response.status_code = 200 if data is not None else 404
+        response._content = json.dumps(data if data is not None else {}).encode()
+        response.headers = CaseInsensitiveDict(
+            {
+                "Content-Type": "application/json; charset=UTF-8",
+                # Always a fresh window: once requests are used, prawcore spreads
+                # the remaining ones over the reset time and sleeps before each
+                "x-ratelimit-remaining": "1000",
+                "x-ratelimit-used": "0",
+                "x-ratelimit-reset": "600",
+            }
+        )
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+
+        return response
+
+    def close(self):
+        pass
+
+
+def get_listing(children):
+    return {
+        "kind": "Listing",
+        "data": {
+            "after": None,
+            "before": None,
+            "dist": len(children),
+            "children": [{"kind": kind, "data": data} for kind, data in children],
+        },
+    }
+
+
+class YouTubeRequest:
+    def __init__(self, responder, response):
+        self.responder = responder
+        self.response = response
+        self.headers = {}
+
+    def get_response(self):
+        # Conditional requests on an unchanged ETag are answered with a 304
+        etag = self.response.get("etag")
+        if etag is not None and self.headers.get("If-None-Match") == etag:
+            import httplib2
+            from googleapiclient.errors import HttpError
+
+            raise HttpError(httplib2.Response({"status": 304}), b"")
+
+        return self.response
+
+    def execute(self):
+        time.sleep(self.responder.latency_seconds)
+        return self.get_response()
+
+
+class YouTubeResource:
+    def __init__(self, list_function):
+        self.list = list_function
+
+
+class YouTubeBatchRequest:
+    def __init__(self, responder, callback):
+        self.responder = responder
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self):
+        # One round trip for the whole batch
+        time.sleep(self.responder.latency_seconds)
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request.get_response(), None
+            except Exception as e:
+                response, exception = None, e
+            callback(request_id, response, exception)
+
+
+class YouTubeResponder:
+    """
+    Stand-in for the YouTube Data API client: the videos and commentThreads list
+    requests, and HTTP batches of them.
+    """
+
+    def __init__(self, videos_count, comments_count, latency_seconds, seed=0):
+        self.videos_count = videos_count
+        self.comments_count = comments_count
+        self.latency_seconds = latency_seconds
+        self.seed = seed
+
+    def get_videos(self, video_category_id):
+        rng = random.Random(f"{self.seed}-{video_category_id}")
+
+        videos = []
+        for i in range(self.videos_count):
+            published_at = datetime.utcnow() - timedelta(hours=rng.randint(1, 24 * 14))
+            view_count = rng.randint(1000, 5000000)
+            videos.append(
+                {
+                    "kind": "youtube#video",
+                    "etag": f"etag{video_category_id}{i}",
+                    "id": f"vid{video_category_id}x{i:05d}",
+                    "snippet": {
+                        "publishedAt": published_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                        "title": get_title(rng),
+                        "categoryId": str(video_category_id),
+                    },
+                    "statistics": {
+                        "viewCount": str(view_count),
+                        "likeCount": str(rng.randint(0, view_count // 20)),
+                        "commentCount": str(rng.randint(0, view_count // 200)),
+                    },
+                }
+            )
+
+        return videos
+
+    def list_videos(self, videoCategoryId=None, maxResults=5, pageToken=None, **kwargs):
+        videos = self.get_videos(videoCategoryId)
+        start = int(pageToken or 0)
+
+        response = {
+            "kind": "youtube#videoListResponse",
+            # Stable across runs, as if the chart hadn't changed
+            "etag": f"etag{videoCategoryId}-{start}-{maxResults}",
+            "items": videos[start : start + maxResults],
+            "pageInfo": {"totalResults": len(videos), "resultsPerPage": maxResults},
+        }
+        if start + maxResults < len(videos):
+            response["nextPageToken"] = str(start + maxResults)
+
+        return YouTubeRequest(self, response)
+
+    def list_comment_threads(self, videoId=None, maxResults=20, **kwargs):
+        rng = random.Random(f"{self.seed}-{videoId}")
+
+        items = [
+            {
+                "kind": "youtube#commentThread",
+                "snippet": {
+                    "videoId": videoId,
+                    "topLevelComment": {"snippet": {"textDisplay": get_comment(rng)}},
+                },
+            }
+            for _ in range(min(maxResults, self.comments_count))
+        ]
+
+        return YouTubeRequest(
+            self, {"kind": "youtube#commentThreadListResponse", "items": items}
+        )
+
+    def videos(self):
+        return YouTubeResource(self.list_videos)
+
+    def commentThreads(self):
+        return YouTubeResource(self.list_comment_threads)
+
+    def new_batch_http_request(self, callback=None):
+        return YouTubeBatchRequest(self, callback)
@@ -0,0 +1,296 @@
+"""
+Offline end-to-end benchmark of the pipelines. Every stage of a source runs in
+its own process, like on ECS, against local stand-ins: generated Reddit/YouTube
+API responses, a fake inference endpoint and summarizer with configurable
+latency, a local directory instead of S3 and SQLite instead of MySQL.
+
+Prints items/second and p50/p95 latencies per stage, and appends the results to
+a JSON lines file so that they can be compared across commits:
+
+    python benchmark/run_benchmark.py --source reddit --shards 3 --items 100
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+FAKES_DIR = os.path.join(BENCHMARK_DIR, "fakes")
+
+EXECUTION_DATE = datetime(2023, 6, 1, 12)
+
+SOURCES = {
+    "reddit": {
+        "src": os.path.join(REPO_DIR, "reddit_signals", "src"),
+        "stages": [
+            ("fetch", "entry_get_subreddit_data"),
+            ("combine", "entry_get_combined_data"),
+            ("write_to_db", "entry_write_to_db"),
+        ],
+        "shard_key": "subreddit",
+        "shards": ["worldnews", "technology", "business", "movies", "sports"],
+        "processed_metric": "process_submission_data",
+        "config": {
+            "reddit_id": "benchmark",
+            "reddit_secret": "benchmark",
+            "reddit_username": "benchmark",
+            "reddit_password": "benchmark",
+        },
+    },
+    "youtube": {
+        "src": os.path.join(REPO_DIR, "youtube_signals", "src"),
+        "stages": [
+            ("fetch", "entry_get_video_category_data"),
+            ("combine", "entry_get_combined_data"),
+            ("write_to_db", "entry_write_to_db"),
+        ],
+        "shard_key": "video_category",
+        "shards": ["1", "10", "17", "20", "24", "25", "28"],
+        "processed_metric": "process_video_data",
+        "config": {"google_api_key": "benchmark"},
+    },
+}
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def get_stage_env(args, source_info, work_dir, execution_date):
+    env = dict(os.environ)
+    env.update(
+        {
+            "PYTHONPATH": os.pathsep.join(
+                [source_info["src"], FAKES_DIR, BENCHMARK_DIR]
+            ),
+            "execution_date": execution_date.isoformat(),
+            "config": repr(source_info["config"]),
+            "DATA_LOCATION": os.path.join(work_dir, "data"),
+            "INFERENCE_CACHE_PATH": os.path.join(work_dir, "inference_cache.sqlite"),
+            "INFERENCE_CACHE_LOCATION": os.path.join(
+                work_dir, "data", "_cache", "inference_cache"
+            ),
+            "BENCHMARK_DB_URL": f"sqlite:///{os.path.join(work_dir, 'signals.sqlite')}",
+            "BENCHMARK_ITEMS": str(args.items),
+            "BENCHMARK_COMMENTS": str(args.comments),
+            "BENCHMARK_SEED": str(args.seed),
+            "BENCHMARK_API_LATENCY_MS": str(args.api_latency_ms),
+            "BENCHMARK_INFERENCE_LATENCY_MS": str(args.inference_latency_ms),
+            "BENCHMARK_SUMMARY_LATENCY_MS": str(args.summary_latency_ms),
+            "BENCHMARK_REDDIT_REQUESTS_PER_MINUTE": str(
+                args.reddit_requests_per_minute
+            ),
+            # praw would otherwise look for a newer version on PyPI
+            "praw_check_for_updates": "False",
+        }
+    )
+
+    return env
+
+
+def run_stage(source, module_name, configs, env, work_dir):
+    report_path = os.path.join(work_dir, f"{module_name}.report.json")
+    log_path = os.path.join(work_dir, f"{module_name}.log")
+    env = dict(env, BENCHMARK_REPORT_PATH=report_path)
+
+    with open(log_path, "a") as log:
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.join(BENCHMARK_DIR, "run_stage.py"),
+                source,
+                module_name,
+                json.dumps(configs),
+            ],
+            cwd=work_dir,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            check=True,
+        )
+
+    with open(report_path) as f:
+        report = json.load(f)
+
+    prawcore_sleeps = report["counters"].get("benchmark.prawcore_sleeps", 0)
+    if prawcore_sleeps:
+        raise RuntimeError(
+            f"prawcore slept {prawcore_sleeps} time(s) for Reddit's rate limit in "
+            f"{module_name}, so its timings aren't the pipeline's; see {log_path}"
+        )
+
+    return report
+
+
+def get_combined_rows_count(work_dir, execution_date):
+    partition_dir = os.path.join(
+        work_dir,
+        "data",
+        execution_date.strftime("year=%Y/month=%m/day=%d/time=%H%M%S"),
+    )
+
+    rows_count = 0
+    for path in glob.glob(os.path.join(partition_dir, "combined.*")):
+        if path.endswith(".parquet"):
+            rows_count += len(pd.read_parquet(path))
+        else:
+            rows_count += len(pd.read_csv(path))
+
+    return rows_count
+
+
+def get_stage_result(stage, report, items_count):
+    wall_seconds = report["wall_seconds"]
+    items_per_second = items_count / wall_seconds if wall_seconds else 0.0
+
+    return {
+        "stage": stage,
+        "wall_seconds": round(wall_seconds, 3),
+        "items": items_count,
+        "items_per_second": round(items_per_second, 3),
+        "latencies": {
+            name: {
+                "calls": metric["calls"],
+                "errors": metric["errors"],
+                "p50_seconds": metric["p50_seconds"],
+                "p95_seconds": metric["p95_seconds"],
+            }
+            for name, metric in report["metrics"].items()
+        },
+        "counters": report["counters"],
+    }
+
+
+def run_source(args, source, run, work_dir):
+    source_info = SOURCES[source]
+    execution_date = EXECUTION_DATE + timedelta(hours=run)
+    env = get_stage_env(args, source_info, work_dir, execution_date)
+
+    shard_configs = [
+        dict(source_info["config"], **{source_info["shard_key"]: shard})
+        for shard in source_info["shards"][: args.shards]
+    ]
+
+    reports = {}
+    for stage, module_name in source_info["stages"]:
+        print(f"Running {source} {stage} ({module_name})...")
+        configs = shard_configs if stage == "fetch" else [source_info["config"]]
+        reports[stage] = run_stage(source, module_name, configs, env, work_dir)
+
+    # Fetch and combine are measured on the rows they produce, writing to the DB
+    # on the candidates that it fetched, inferred and summarized
+    combined_rows_count = get_combined_rows_count(work_dir, execution_date)
+    processed_metric = reports["write_to_db"]["metrics"].get(
+        source_info["processed_metric"], {}
+    )
+    items_counts = {
+        "fetch": combined_rows_count,
+        "combine": combined_rows_count,
+        "write_to_db": processed_metric.get("calls", 0),
+    }
+
+    return [
+        get_stage_result(stage, report, items_counts[stage])
+        for stage, report in reports.items()
+    ]
+
+
+def print_results(source, run, results):
+    print(f"\n{source} run {run}")
+    print(f"{'stage':<14}{'seconds':>10}{'items':>8}{'items/s':>10}")
+    for result in results:
+        print(
+            f"{result['stage']:<14}{result['wall_seconds']:>10.2f}"
+            f"{result['items']:>8}{result['items_per_second']:>10.2f}"
+        )
+        for name, latency in result["latencies"].items():
+            print(
+                f"    {name:<36} calls {latency['calls']:>6}  "
+                f"p50 {latency['p50_seconds']:.3f}s  p95 {latency['p95_seconds']:.3f}s"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--source", choices=list(SOURCES) + ["all"], default="all")
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=1,
+        help="Runs in the same state; later runs measure the incremental path",
+    )
+    parser.add_argument("--shards", type=int, default=3, help="Subreddits/categories")
+    parser.add_argument("--items", type=int, default=50, help="Items per shard")
+    parser.add_argument("--comments", type=int, default=60, help="Comments per item")
+    parser.add_argument("--api-latency-ms", type=float, default=100)
+    parser.add_argument("--inference-latency-ms", type=float, default=50)
+    parser.add_argument("--summary-latency-ms", type=float, default=200)
+    parser.add_argument(
+        "--reddit-requests-per-minute",
+        type=float,
+        default=0,
+        help="Client-side Reddit quota; 0 turns it off",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Kept after the run when set")
+    parser.add_argument("--output", default="benchmark_results.jsonl")
+    args = parser.parse_args()
+
+    sources = list(SOURCES) if args.source == "all" else [args.source]
+    git_commit = get_git_commit()
+    for source in sources:
+        if args.work_dir:
+            work_dir = os.path.join(args.work_dir, source)
+            os.makedirs(work_dir, exist_ok=True)
+            temporary_dir = None
+        else:
+            temporary_dir = tempfile.TemporaryDirectory(prefix=f"benchmark_{source}_")
+            work_dir = temporary_dir.name
+
+        try:
+            for run in range(args.runs):
+                start = time.perf_counter()
+                results = run_source(args, source, run, work_dir)
+                print_results(source, run, results)
+
+                with open(args.output, "a") as f:
+                    record = {
+                        "created_at": datetime.utcnow().isoformat(),
+                        "git_commit": git_commit,
+                        "source": source,
+                        "run": run,
+                        "parameters": {
+                            key: value
+                            for key, value in vars(args).items()
+                            if key not in ("source", "work_dir", "output")
+                        },
+                        "total_seconds": round(time.perf_counter() - start, 3),
+                        "stages": results,
+                    }
+                    f.write(json.dumps(record) + "\n")
+        finally:
+            if temporary_dir is not None:
+                temporary_dir.cleanup()
+
+    print(f"\nAppended results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
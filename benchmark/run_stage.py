@@ -0,0 +1,99 @@
+"""
+Runs an entry point of a package against the stand-ins, once per config, and
+writes the metrics of the whole stage to BENCHMARK_REPORT_PATH. Started by
+run_benchmark.py with the package src and the fake common_tools on the path.
+"""
+import importlib
+import json
+import os
+import sys
+import time
+
+from responders import RedditResponder, YouTubeResponder
+
+UNTHROTTLED_REQUESTS_PER_MINUTE = 10**9
+
+
+def install_prawcore_sleep_check():
+    # prawcore paces requests from the rate limit headers; the stand-in's never
+    # ask for a wait, so any sleep would be timed instead of the pipeline
+    from metrics import increment
+    from prawcore.rate_limit import RateLimiter as PrawcoreRateLimiter
+
+    delay = PrawcoreRateLimiter.delay
+
+    def checked_delay(self):
+        next_request_timestamp = self.next_request_timestamp
+        if next_request_timestamp is not None and next_request_timestamp > time.time():
+            increment("benchmark.prawcore_sleeps")
+        return delay(self)
+
+    PrawcoreRateLimiter.delay = checked_delay
+
+
+def install_responders(source):
+    latency_seconds = float(os.environ["BENCHMARK_API_LATENCY_MS"]) / 1000
+    items_count = int(os.environ["BENCHMARK_ITEMS"])
+    comments_count = int(os.environ["BENCHMARK_COMMENTS"])
+    seed = int(os.environ["BENCHMARK_SEED"])
+
+    if source == "reddit":
+        import reddit
+        from rate_limiter import RateLimiter
+
+        responder = RedditResponder(items_count, comments_count, latency_seconds, seed)
+        get_http_session = reddit.get_http_session
+
+        def get_benchmark_session():
+            session = get_http_session()
+            session.mount("https://", responder)
+            return session
+
+        reddit.get_http_session = get_benchmark_session
+        install_prawcore_sleep_check()
+
+        # Reddit's quota would otherwise dominate the timings; 0 turns it off
+        requests_per_minute = float(os.environ["BENCHMARK_REDDIT_REQUESTS_PER_MINUTE"])
+        if requests_per_minute <= 0:
+            requests_per_minute = UNTHROTTLED_REQUESTS_PER_MINUTE
+        reddit.REDDIT_RATE_LIMITER = RateLimiter(
+            rate_per_minute=requests_per_minute,
+            capacity=max(reddit.REDDIT_RATE_LIMITER.capacity, requests_per_minute / 60),
+        )
+    else:
+        import youtube
+        from rate_limiter import RateLimiter
+
+        youtube._YOUTUBE = YouTubeResponder(
+            items_count, comments_count, latency_seconds, seed
+        )
+
+        # Runs with many items would otherwise use up a day of quota
+        youtube.YOUTUBE_RATE_LIMITER = RateLimiter(
+            rate_per_minute=UNTHROTTLED_REQUESTS_PER_MINUTE,
+            capacity=UNTHROTTLED_REQUESTS_PER_MINUTE,
+        )
+
+
+def main():
+    source, module_name, configs = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+
+    install_responders(source)
+    entry = importlib.import_module(module_name)
+
+    start = time.perf_counter()
+    for config in configs:
+        os.environ["config"] = repr(config)
+        entry.main()
+    wall_seconds = time.perf_counter() - start
+
+    from metrics import get_run_report
+
+    report = get_run_report(module_name)
+    report["wall_seconds"] = wall_seconds
+    with open(os.environ["BENCHMARK_REPORT_PATH"], "w") as f:
+        json.dump(report, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,8 @@ dag_id = f"reddit_signals_version_{version}"
 # Subreddits
 subreddits_info = Variable.get("subreddits_info", deserialize_json=True)
 subreddit_list = subreddits_info["subreddit_list"]
+# Number of subreddits fetched by one task; 1 runs a task per subreddit
+shard_size = int(subreddits_info.get("shard_size", 1))
 
 # Secret OpenAI info
 secret_opeinai_info = Variable.get("secret_opeinai_info", deserialize_json=True)
@@ -56,6 +58,17 @@ def set_config(subreddit):
     return config
 
 
+def set_shard_config(subreddits, shard):
+    config = set_config("None")
+    config["subreddits"] = subreddits
+    config["shard"] = shard
+    return config
+
+
+def get_shards(items, shard_size):
+    return [items[i : i + shard_size] for i in range(0, len(items), shard_size)]
+
+
 def create_dag():
     """
     Format for schedule_interval:
@@ -139,18 +152,30 @@ combined_data_task = get_ecs_operator(
     dag=dag,
 )
 
-for subreddit in subreddit_list:
-    subreddit_task = f"subreddit_task_{subreddit}"
-    subreddit_task = get_ecs_operator(
-        entry_file="entry_get_subreddit_data.py",
-        config=str(set_config(subreddit)),
-        task_id=f"subreddit_{subreddit}_signals_task",
-        task_definition=task_definition,
-        ecs_container_name=ecs_container_name,
-        cluster=cluster,
-        subnets_list=subnets_list,
-        dag=dag,
-    )
+for shard, subreddits in enumerate(get_shards(subreddit_list, shard_size)):
+    if shard_size == 1:
+        subreddit = subreddits[0]
+        subreddit_task = get_ecs_operator(
+            entry_file="entry_get_subreddit_data.py",
+            config=str(set_config(subreddit)),
+            task_id=f"subreddit_{subreddit}_signals_task",
+            task_definition=task_definition,
+            ecs_container_name=ecs_container_name,
+            cluster=cluster,
+            subnets_list=subnets_list,
+            dag=dag,
+        )
+    else:
+        subreddit_task = get_ecs_operator(
+            entry_file="entry_get_subreddits_data.py",
+            config=str(set_shard_config(subreddits, shard)),
+            task_id=f"subreddits_shard_{shard}_signals_task",
+            task_definition=task_definition,
+            ecs_container_name=ecs_container_name,
+            cluster=cluster,
+            subnets_list=subnets_list,
+            dag=dag,
+        )
     start_task.set_downstream(subreddit_task)
     subreddit_task.set_downstream(combined_data_task)
 
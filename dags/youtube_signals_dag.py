@@ -11,6 +11,8 @@ dag_id = f"youtube_signals_version_{version}"
 # YouTube video categories
 video_category_info = Variable.get("video_category_info", deserialize_json=True)
 video_category_list = video_category_info["video_category_list"]
+# Number of video categories fetched by one task; 1 runs a task per category
+shard_size = int(video_category_info.get("shard_size", 1))
 
 # Secret OpenAI info
 secret_opeinai_info = Variable.get("secret_opeinai_info", deserialize_json=True)
@@ -50,6 +52,17 @@ def set_config(video_category):
     return config
 
 
+def set_shard_config(video_categories, shard):
+    config = set_config("None")
+    config["video_categories"] = video_categories
+    config["shard"] = shard
+    return config
+
+
+def get_shards(items, shard_size):
+    return [items[i : i + shard_size] for i in range(0, len(items), shard_size)]
+
+
 def create_dag():
     """
     Format for schedule_interval:
@@ -133,18 +146,30 @@ combined_data_task = get_ecs_operator(
     dag=dag,
 )
 
-for video_category in video_category_list:
-    video_category_task = f"video_category_task_{video_category}"
-    video_category_task = get_ecs_operator(
-        entry_file="entry_get_video_category_data.py",
-        config=str(set_config(video_category)),
-        task_id=f"video_category_{video_category}_signals_task",
-        task_definition=task_definition,
-        ecs_container_name=ecs_container_name,
-        cluster=cluster,
-        subnets_list=subnets_list,
-        dag=dag,
-    )
+for shard, video_categories in enumerate(get_shards(video_category_list, shard_size)):
+    if shard_size == 1:
+        video_category = video_categories[0]
+        video_category_task = get_ecs_operator(
+            entry_file="entry_get_video_category_data.py",
+            config=str(set_config(video_category)),
+            task_id=f"video_category_{video_category}_signals_task",
+            task_definition=task_definition,
+            ecs_container_name=ecs_container_name,
+            cluster=cluster,
+            subnets_list=subnets_list,
+            dag=dag,
+        )
+    else:
+        video_category_task = get_ecs_operator(
+            entry_file="entry_get_video_categories_data.py",
+            config=str(set_shard_config(video_categories, shard)),
+            task_id=f"video_categories_shard_{shard}_signals_task",
+            task_definition=task_definition,
+            ecs_container_name=ecs_container_name,
+            cluster=cluster,
+            subnets_list=subnets_list,
+            dag=dag,
+        )
     start_task.set_downstream(video_category_task)
     video_category_task.set_downstream(combined_data_task)
 
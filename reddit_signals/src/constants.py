@@ -1,11 +1,95 @@
+import os
+
 # Weights for Social Signals rank
 SUBMISSION_WEIGHT = 0.25
 COMMENT_WEIGHT = 0.75
+# Weight of the velocity rank; 0 keeps the Social Signals rank a single snapshot
+VELOCITY_WEIGHT = 0.0
 
 # For submission data
 SUBMISSION_TIME_FILTER = "day"
 SUBMISSION_LIMIT = 20
+COUNT_COLUMNS = [
+    "submission_up_votes_count",
+    "submission_comments_count",
+    "submission_views_count",
+]
+# Number of submission batches enriched concurrently
+SUBMISSION_WORKERS = 4
+
+# For Reddit client
+# Max number of pooled connections per host
+REDDIT_POOL_SIZE = 10
+# Reddit allows 100 queries per minute per OAuth client
+REDDIT_REQUESTS_PER_MINUTE = 100
+REDDIT_REQUESTS_BURST = 10
+
+# For rate limiting API calls
+# Where the token buckets live; can be one of: "memory://" for a single process,
+# "file:///path/to/directory" for the processes of a host, or "redis://host:port/db"
+# to share them across all the tasks using the same credentials
+RATE_LIMITER_URL = os.environ.get("RATE_LIMITER_URL", "memory://")
 
 # For comments data
 COMMENT_SORT = "top"
 COMMENT_LIMIT = 20
+# Top-level comments requested per usable comment, as some are filtered out
+COMMENT_FETCH_FACTOR = 2
+
+# For incremental runs
+# Enrichment results of an id are reused for this many days
+ENRICHMENT_STATE_TTL_DAYS = 3
+# Counter snapshots kept per id, enough for velocity and acceleration
+COUNTER_SNAPSHOTS = 3
+COUNTER_STATE_TTL_DAYS = 3
+# Run objects of counter snapshots merged together once there are more of them
+COUNTER_STATE_COMPACT_OBJECTS = 24
+
+# For SageMaker inference
+# Number of comments classified together before the usable ones are counted
+INFERENCE_BATCH_SIZE = 10
+# Number of requests in flight across all the callers of a process
+INFERENCE_WORKERS = 20
+
+# For inference cache shared across runs
+# Both can be overridden, e.g. to run against a local directory
+INFERENCE_CACHE_PATH = os.environ.get(
+    "INFERENCE_CACHE_PATH", "/tmp/inference_cache.sqlite"
+)
+# Directory of the compacted cache and of the deltas of the tasks since
+INFERENCE_CACHE_LOCATION = os.environ.get(
+    "INFERENCE_CACHE_LOCATION",
+    "s3://social-signals-dev-data/reddit/_cache/inference_cache",
+)
+INFERENCE_CACHE_TTL_DAYS = 7
+INFERENCE_CACHE_MAX_ENTRIES = 200000
+
+# For writing to the DB
+# Prefix of the source of the rows written by this pipeline
+SOURCE_PREFIX = "https://reddit.com/r/"
+# Number of rows per multi-row INSERT
+DB_FLUSH_SIZE = 100
+
+# For intermediate data
+# Can be any fsspec URL, e.g. "memory://" or a local directory for offline runs
+DATA_LOCATION = os.environ.get("DATA_LOCATION", "s3://social-signals-dev-data/reddit")
+# Can be one of: "csv" or "parquet"
+DATA_FORMAT = "csv"
+# Number of threads parsing partition objects
+READ_WORKERS = 8
+# Local copies of remote objects, reused while their ETag is unchanged
+STORAGE_CACHE_DIR = os.environ.get("STORAGE_CACHE_DIR", "/tmp/storage_cache")
+STORAGE_CACHE_MAX_BYTES = 1024**3
+
+# For combining the per-source data
+# Can be one of: "full", which ranks all the rows in memory, or "streaming", which
+# ranks them a chunk at a time and keeps the top COMBINE_TOP_N of each bucket
+COMBINE_MODE = "full"
+# Candidates kept per (category, sub_category), above the rows written per bucket
+COMBINE_TOP_N = 50
+# Number of per-source objects read and ranked together when streaming
+COMBINE_CHUNK_SIZE = 16
+
+# For summarization
+# Size of the summary process pool; set to the vCPU count of the task
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", os.cpu_count() or 1))
@@ -0,0 +1,150 @@
+import time
+
+import pandas as pd
+from constants import DB_FLUSH_SIZE
+from metrics import increment, timed
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.dialects import mysql, sqlite
+
+from common_tools.common_constants import SCHEMA, TABLE_NAME
+from common_tools.db import get_engine
+
+_CONNECTION = None
+
+# A row is identified by its source and the run partition it was written for
+UPSERT_KEY_COLUMNS = ["source", "year", "month", "day", "time"]
+UPSERT_INDEX_NAME = "ux_source_run"
+# Prefix lengths, as pandas creates the columns as TEXT
+UPSERT_INDEX_COLUMNS = "source(255), year(4), month(2), day(2), time(6)"
+
+
+def get_connection():
+    # Created on first use, so that importing the module doesn't touch the DB
+    global _CONNECTION
+
+    if _CONNECTION is None:
+        _CONNECTION = create_engine(get_engine(), pool_pre_ping=True)
+
+    return _CONNECTION
+
+
+def get_table_name():
+    if SCHEMA:
+        return f"{SCHEMA}.{TABLE_NAME}"
+    return TABLE_NAME
+
+
+def upsert_on_duplicate_key(pd_table, connection, keys, data_iter):
+    """
+    to_sql insertion method: multi-row INSERT ... ON DUPLICATE KEY UPDATE, so that
+    rows already written by an earlier attempt of the run are updated in place.
+    """
+    rows = [dict(zip(keys, row)) for row in data_iter]
+
+    # SQLite, used for offline runs, has no ON DUPLICATE KEY; rows are replaced
+    if connection.dialect.name == "sqlite":
+        statement = sqlite.insert(pd_table.table).prefix_with("OR REPLACE")
+        statement = statement.values(rows)
+        connection.execute(statement)
+        return
+
+    statement = mysql.insert(pd_table.table).values(rows)
+    statement = statement.on_duplicate_key_update(
+        {key: statement.inserted[key] for key in keys if key not in UPSERT_KEY_COLUMNS}
+    )
+    connection.execute(statement)
+
+
+def create_upsert_index():
+    """
+    Migration helper: creates the unique index that upsert_on_duplicate_key relies
+    on. Safe to run more than once.
+    """
+    indexes = inspect(get_connection()).get_indexes(TABLE_NAME, schema=SCHEMA)
+    if any(index["name"] == UPSERT_INDEX_NAME for index in indexes):
+        print(f"Index {UPSERT_INDEX_NAME} already exists")
+        return
+
+    table_name = get_table_name()
+    with get_connection().begin() as connection:
+        duplicates_count = connection.execute(
+            text(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM {table_name} "
+                f"GROUP BY {', '.join(UPSERT_KEY_COLUMNS)} HAVING COUNT(*) > 1) d"
+            )
+        ).scalar()
+        if duplicates_count:
+            raise ValueError(
+                f"Found {duplicates_count} duplicated rows in {table_name}; "
+                f"remove them before creating index {UPSERT_INDEX_NAME}"
+            )
+
+        print(f"Creating index {UPSERT_INDEX_NAME} on {table_name}")
+        connection.execute(
+            text(
+                f"CREATE UNIQUE INDEX {UPSERT_INDEX_NAME} "
+                f"ON {table_name} ({UPSERT_INDEX_COLUMNS})"
+            )
+        )
+
+
+def is_partition_written(year, month, day, time, source_prefix):
+    """
+    Rows of a run are written in one transaction, so any row for the partition
+    means that the run has already been written.
+    """
+    if not inspect(get_connection()).has_table(TABLE_NAME, schema=SCHEMA):
+        return False
+
+    with get_connection().connect() as connection:
+        row_count = connection.execute(
+            text(
+                f"SELECT COUNT(*) FROM {get_table_name()} "
+                "WHERE year = :year AND month = :month AND day = :day "
+                "AND time = :time AND source LIKE :source"
+            ),
+            {
+                "year": year,
+                "month": month,
+                "day": day,
+                "time": time,
+                "source": f"{source_prefix}%",
+            },
+        ).scalar()
+
+    return row_count > 0
+
+
+@timed("write_rows_to_db")
+def write_rows_to_db(rows, flush_size=DB_FLUSH_SIZE):
+    """
+    Upserts all the rows accumulated over a run in one transaction, as multi-row
+    INSERTs of flush_size rows each. Returns a summary of the write.
+    """
+    summary = {"rows_written": 0, "db_seconds": 0.0}
+    if not rows:
+        print("No rows to write to the DB")
+        return summary
+
+    start = time.perf_counter()
+    db_df = pd.DataFrame(data=rows)
+    with get_connection().begin() as connection:
+        db_df.to_sql(
+            name=TABLE_NAME,
+            con=connection,
+            schema=SCHEMA,
+            if_exists="append",
+            index=False,
+            method=upsert_on_duplicate_key,
+            chunksize=flush_size,
+        )
+
+    summary["rows_written"] = len(db_df)
+    increment("db.rows_written", len(db_df))
+    summary["db_seconds"] = time.perf_counter() - start
+    print(
+        f"Wrote {summary['rows_written']} rows to the DB "
+        f"in {summary['db_seconds']:.2f} seconds"
+    )
+
+    return summary
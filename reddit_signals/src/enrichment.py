@@ -0,0 +1,189 @@
+from enrichment_state import ENRICHMENT_COLUMNS, is_enriched, set_enrichment
+from entities import get_titles_entities
+from inference import (
+    get_categories_batch,
+    get_comments_emotion,
+    get_emotion_batch,
+    get_ner_batch,
+)
+
+from common_tools.common_constants import CLASSIFICATION_THRESHOLD, NONE_FILLER
+
+
+class SourceAdapter:
+    """
+    What the enrichment engine needs from a source: how to read the id, title and
+    counters of its items, which of them are candidates, and how to fetch the
+    comments of an item. Inference, filtering and the output rows are shared.
+    """
+
+    # Output columns of the id and title of an item
+    id_column = "id"
+    title_column = "title"
+
+    def get_item_id(self, item):
+        raise NotImplementedError
+
+    def get_item_title(self, item):
+        raise NotImplementedError
+
+    def is_candidate(self, item):
+        return True
+
+    def get_item_fields(self, item):
+        # Fields written before the id and title, e.g. the name of the subreddit
+        return {}
+
+    def get_item_stats(self, item):
+        raise NotImplementedError
+
+    def get_item_comments(self, item_id, comment_limit):
+        raise NotImplementedError
+
+
+def get_title_sub_category(sub_category):
+    if isinstance(sub_category, dict):
+        title_sub_category_label = sub_category["labels"][0]
+        title_sub_category_score = sub_category["scores"][0]
+
+        if title_sub_category_score >= 0.25:
+            return title_sub_category_label
+
+    return "Miscellaneous"
+
+
+def get_items_data(adapter, items, enrichment_state=None):
+    """
+    The titles of all the candidate items are sent to NER and sub-category
+    inference together, and the results are fanned back out to the items. Returns
+    data only for accepted items, in the order of items.
+
+    With enrichment_state, items enriched in an earlier run reuse its results and
+    only get their counters refreshed; results for new ones are added to it.
+    """
+    if enrichment_state is None:
+        enrichment_state = {}
+
+    candidates = []
+    for item in items:
+        print(f"Title: {adapter.get_item_title(item)}")
+        if adapter.is_candidate(item):
+            candidates.append(item)
+
+    enrichments, new_candidates = {}, []
+    for item in candidates:
+        item_id, item_title = adapter.get_item_id(item), adapter.get_item_title(item)
+        if is_enriched(enrichment_state, item_id, item_title):
+            enrichments[item_id] = enrichment_state[item_id]
+        else:
+            new_candidates.append(item)
+    print(f"Reusing enrichment of {len(enrichments)} items")
+
+    titles = [adapter.get_item_title(item) for item in new_candidates]
+    print(f"Getting entities for {len(titles)} titles...")
+    titles_ner = get_ner_batch(titles)
+    titles_entities = get_titles_entities(titles_ner)
+
+    # Only the titles with expected entities need a sub-category
+    # Results of failed requests aren't kept in the state, so they are retried
+    candidates_entities = []
+    for item, title_ner, title_entities in zip(
+        new_candidates, titles_ner, titles_entities
+    ):
+        item_id, item_title = adapter.get_item_id(item), adapter.get_item_title(item)
+        if title_entities is None:
+            print(f"Expected entities not found for {item_id}. Quitting...")
+            set_enrichment(enrichments, item_id, item_title, None, None)
+            if isinstance(title_ner, list):
+                enrichment_state[item_id] = enrichments[item_id]
+            continue
+        candidates_entities.append((item, title_entities))
+
+    titles = [adapter.get_item_title(item) for item, _ in candidates_entities]
+    print(f"Getting sub-category for {len(titles)} titles...")
+    titles_sub_category = get_categories_batch(titles)
+
+    for (item, title_entities), sub_category in zip(
+        candidates_entities, titles_sub_category
+    ):
+        item_id = adapter.get_item_id(item)
+        set_enrichment(
+            enrichments,
+            item_id,
+            adapter.get_item_title(item),
+            title_entities,
+            get_title_sub_category(sub_category),
+        )
+        if isinstance(sub_category, dict):
+            enrichment_state[item_id] = enrichments[item_id]
+
+    items_data = []
+    for item in candidates:
+        enrichment = enrichments[adapter.get_item_id(item)]
+        if not enrichment["accepted"]:
+            continue
+
+        item_data = adapter.get_item_fields(item)
+        item_data[adapter.id_column] = adapter.get_item_id(item)
+        item_data[adapter.title_column] = adapter.get_item_title(item)
+        for column in ENRICHMENT_COLUMNS:
+            item_data[column] = enrichment[column]
+
+        item_stats = adapter.get_item_stats(item)
+        item_data.update(item_stats)
+        enrichment.update(item_stats)
+
+        items_data.append(item_data)
+
+    return items_data
+
+
+def process_item_data(
+    adapter, item_id, item_title, comment_limit, comments=None, summarize=True
+):
+    """
+    Gets the emotion of the title and of the comments of an item, and optionally
+    summarizes its usable comments. Comments are fetched through the adapter
+    unless given, e.g. when they were fetched in a batch already.
+    """
+    item_data = {}
+
+    print("Getting emotion for the title...")
+    title_emotion = get_emotion_batch([item_title])[0]
+    if isinstance(title_emotion, list):
+        if title_emotion:
+            title_emotion = title_emotion[0]
+            title_emotion_prediction = title_emotion["label"]
+            title_emotion_score = title_emotion["score"]
+            if title_emotion_score >= CLASSIFICATION_THRESHOLD:
+                item_data["title_emotion"] = title_emotion_prediction
+            else:
+                item_data["title_emotion"] = "neutral"
+
+    print("Going over comments...")
+    if comments is None:
+        comments = adapter.get_item_comments(item_id, comment_limit)
+    comments, comments_emotion_counter = get_comments_emotion(
+        comments, comment_limit=comment_limit
+    )
+    print(f"Found {len(comments)} comments")
+
+    if comments_emotion_counter:
+        item_data["comments_emotion"] = max(
+            comments_emotion_counter, key=comments_emotion_counter.get
+        )
+    else:
+        item_data["comments_emotion"] = "neutral"
+
+    # Comments can be summarized by the caller instead, e.g. in a process pool
+    if not summarize:
+        item_data["comments"] = comments
+    elif comments:
+        from common_tools.sumy_summary import get_sumy_summary
+
+        summary = get_sumy_summary(comments)
+        item_data["comments_summary"] = summary
+    else:
+        item_data["comments_summary"] = NONE_FILLER
+
+    return item_data
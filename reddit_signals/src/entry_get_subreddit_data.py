@@ -1,38 +1,84 @@
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import pandas as pd
-from constants import SUBMISSION_LIMIT, SUBMISSION_TIME_FILTER
-from reddit import get_submission_data, get_top_submissions
+from constants import (
+    INFERENCE_BATCH_SIZE,
+    SUBMISSION_LIMIT,
+    SUBMISSION_TIME_FILTER,
+    SUBMISSION_WORKERS,
+)
+from enrichment_state import load_enrichment_state, save_enrichment_state
+from inference import get_batches
+from inference_cache import sync_inference_cache
+from metrics import timed, timed_block, write_run_report
+from reddit import get_submissions_data, get_top_submissions, print_reddit_stats
+from storage import get_partition_path, write_df
 
 
-def get_subreddit_data(year, month, day, time, subreddit_name):
+@timed("get_subreddit_data")
+def get_subreddit_data(
+    year, month, day, time, subreddit_name, workers=SUBMISSION_WORKERS
+):
     print(f"Subreddit is {subreddit_name}")
 
     subreddit, top_submissions = get_top_submissions(
         subreddit_name=subreddit_name, time_filter=SUBMISSION_TIME_FILTER
     )
 
+    enrichment_state = load_enrichment_state(subreddit_name)
+
+    # Listing is fetched up front so that the titles can be inferred in batches
+    with timed_block("get_top_submissions"):
+        submissions = list(top_submissions)
+    print(f"Found {len(submissions)} candidate submissions")
+
+    # At most workers batches are in flight; results are consumed in rank order
+    batches = enumerate(get_batches(submissions, INFERENCE_BATCH_SIZE))
     results = []
-    for i, submission in enumerate(top_submissions):
-        print(f"Getting data for submission no. {i}")
-        submission_data = get_submission_data(
-            subreddit=subreddit, submission=submission
-        )
-        if submission_data:
-            results.append(submission_data)
-        if len(results) == SUBMISSION_LIMIT:
-            break
-   
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        def submit_next_batch():
+            next_batch = next(batches, None)
+            if next_batch is None:
+                return
+
+            i, batch = next_batch
+            print(f"Getting data for submission batch no. {i}")
+            future = executor.submit(
+                get_submissions_data,
+                subreddit=subreddit,
+                submissions=batch,
+                enrichment_state=enrichment_state,
+            )
+            pending.append(future)
+
+        for _ in range(workers):
+            submit_next_batch()
+
+        while pending:
+            submissions_data = pending.popleft().result()
+            results.extend(submissions_data)
+            if len(results) >= SUBMISSION_LIMIT:
+                results = results[:SUBMISSION_LIMIT]
+                for future in pending:
+                    future.cancel()
+                break
+            submit_next_batch()
+
+    save_enrichment_state(subreddit_name, enrichment_state)
+
     df = pd.DataFrame(results)
     print(f"Shape of the final dataframe is {df.shape}")
 
     if df.empty:
-        print("DF is emplty, won't be writing to CSV file...")
+        print("DF is emplty, won't be writing to output file...")
     else:
-        output_path = f"s3://social-signals-dev-data/reddit/year={year}/month={month}/day={day}/time={time}/{subreddit}.csv"
-        print(f"Writing output to {output_path}")
-        df.to_csv(output_path, index=False)
+        partition_path = get_partition_path(year, month, day, time)
+        write_df(df, partition_path, name=str(subreddit))
 
 
 def main():
@@ -51,6 +97,11 @@ def main():
     subreddit = str(config["subreddit"])
 
     get_subreddit_data(year, month, day, time, subreddit)
+    sync_inference_cache()
+    print_reddit_stats()
+    write_run_report(
+        get_partition_path(year, month, day, time), task=f"subreddit_{subreddit}"
+    )
     print(
         f"Finished getting subreddit data for year {year}, month {month}, day={day}, and time={time}"
     )
@@ -0,0 +1,63 @@
+import os
+from datetime import datetime
+
+import pandas as pd
+from entry_get_subreddit_data import get_subreddit_data
+from inference_cache import sync_inference_cache
+from metrics import write_run_report
+from reddit import print_reddit_stats
+from storage import get_partition_path
+
+
+def get_subreddits_data(year, month, day, time, subreddit_names):
+    """
+    Gets the data of many subreddits in one process, sharing the Reddit client, its
+    rate limiter and the inference cache. A failing subreddit doesn't stop the
+    others; the names of the failed ones are returned.
+    """
+    failed_subreddit_names = []
+    for i, subreddit_name in enumerate(subreddit_names):
+        print(f"Processing subreddit {i + 1} out of {len(subreddit_names)}")
+        try:
+            get_subreddit_data(year, month, day, time, subreddit_name)
+        except Exception as e:
+            print(f"Couldn't get data for {subreddit_name} due to exception\n{e}")
+            failed_subreddit_names.append(subreddit_name)
+
+    return failed_subreddit_names
+
+
+def main():
+    print("Getting subreddits data...")
+
+    execution_date_str = pd.to_datetime(str(os.environ["execution_date"])).strftime(
+        "%Y-%m-%d-%H-%M-%S"
+    )
+    given_date = datetime.strptime(execution_date_str, "%Y-%m-%d-%H-%M-%S")
+    year = given_date.strftime("%Y")
+    month = given_date.strftime("%m")
+    day = given_date.strftime("%d")
+    time = given_date.strftime("%H%M%S")
+
+    config = eval(os.environ["config"])
+    subreddits = [str(subreddit) for subreddit in config["subreddits"]]
+    shard = config.get("shard", 0)
+
+    failed_subreddits = get_subreddits_data(year, month, day, time, subreddits)
+    sync_inference_cache()
+    print_reddit_stats()
+    write_run_report(
+        get_partition_path(year, month, day, time), task=f"subreddits_shard_{shard}"
+    )
+
+    # Fails the task so that it is retried; done subreddits reuse their enrichment
+    if failed_subreddits:
+        raise RuntimeError(f"Couldn't get data for subreddits {failed_subreddits}")
+
+    print(
+        f"Finished getting data of {len(subreddits)} subreddits for year {year}, month {month}, day={day}, and time={time}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+from db_writer import create_upsert_index
+
+
+def main():
+    print("Migrating DB...")
+
+    create_upsert_index()
+    print("Finished migrating DB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,101 @@
 import os
+from collections import defaultdict, deque
 from datetime import datetime
 
 import pandas as pd
-from constants import COMMENT_LIMIT, COMMENT_SORT
-from reddit import process_submission_data
-from sqlalchemy import create_engine
-
-from common_tools.common_constants import (
-    CATEGORIES,
-    NONE_FILLER,
-    SCHEMA,
-    SUB_CATEGORIES,
-    TABLE_NAME,
+from constants import COMMENT_LIMIT, COMMENT_SORT, SOURCE_PREFIX
+from db_writer import is_partition_written, write_rows_to_db
+from inference_cache import sync_inference_cache
+from metrics import timed, write_run_report
+from reddit import print_reddit_stats, process_submission_data
+from storage import COMBINED_NAME, get_object_path, get_partition_path, read_df
+from summarizer import (
+    get_summary_pool,
+    get_summary_result,
+    print_summary_stats,
+    submit_summary,
 )
-from common_tools.db import get_engine
 
-CONNECTION = create_engine(get_engine(), pool_pre_ping=True)
+from common_tools.common_constants import CATEGORIES, NONE_FILLER, SUB_CATEGORIES
 
 
-def filter_and_write_to_db(
-    year, month, day, time, df, submission_ids, category, sub_category, top_n=3
-):
-    print(f"Processing category {category} and sub-category {sub_category}")
+def get_category_index(df):
+    """
+    Buckets the rows of df by (category, sub_category) in a single pass. df is
+    sorted by social_signals_rank, so every bucket is ranked as well.
+    """
+    category_index = defaultdict(list)
+    for row in df.to_dict("records"):
+        for category in CATEGORIES:
+            if row[category] != NONE_FILLER:
+                category_index[(category, row["sub_category"])].append(row)
 
-    df_category = df[
-        (df[category] != NONE_FILLER) & (df["sub_category"] == sub_category)
-    ]
-    print(f"Shape of the df is {df_category.shape}")
+    return category_index
 
-    count = 0
-    for _, row in df_category.iterrows():
+
+def get_candidates(category_index, category, sub_category, submission_ids):
+    for row in category_index.get((category, sub_category), []):
         submission_id = row["submission_id"]
         if submission_id in submission_ids:
             print(f"Found already proccessed id {submission_id}; skipping...")
             continue
+        yield row
+
+
+def filter_and_write_to_db(
+    year,
+    month,
+    day,
+    time,
+    category_index,
+    submission_ids,
+    rows,
+    summary_pool,
+    category,
+    sub_category,
+    top_n=3,
+):
+    print(f"Processing category {category} and sub-category {sub_category}")
+
+    bucket = category_index.get((category, sub_category), [])
+    print(f"Number of candidates in the bucket is {len(bucket)}")
 
+    # While the oldest candidate is being summarized in the pool, the next ones are
+    # fetched and inferred; never more than needed to reach top_n are in flight
+    candidates = get_candidates(category_index, category, sub_category, submission_ids)
+    pending = deque()
+    count = 0
+    while count < top_n:
+        while count + len(pending) < top_n:
+            row = next(candidates, None)
+            if row is None:
+                break
+
+            submission_data = process_submission_data(
+                submission_id=row["submission_id"],
+                submission_title=row["submission_title"],
+                comment_sort=COMMENT_SORT,
+                comment_limit=COMMENT_LIMIT,
+                summarize=False,
+            )
+            comments = submission_data.pop("comments")
+            future = submit_summary(summary_pool, comments)
+            pending.append((row, submission_data, future))
+
+        if not pending:
+            break
+
+        row, submission_data, future = pending.popleft()
+        submission_id = row["submission_id"]
         submission_title = row["submission_title"]
-        submission_data = process_submission_data(
-            submission_id=submission_id,
-            submission_title=submission_title,
-            comment_sort=COMMENT_SORT,
-            comment_limit=COMMENT_LIMIT,
-        )
-
-        comments_summary = submission_data["comments_summary"]
+
+        comments_summary = get_summary_result(future)
+        submission_data["comments_summary"] = comments_summary
         if len(comments_summary) < 5:
             print(f"Didn't find summary {submission_id}; skipping...")
             continue
 
-        submission_ids.append(submission_id)
+        submission_ids.add(submission_id)
 
         submission_data["year"] = year
         submission_data["month"] = month
@@ -58,50 +105,57 @@ def filter_and_write_to_db(
         submission_data["social_signals_rank"] = row["social_signals_rank"]
 
         subreddit_name = row["subreddit_name"]
-        submission_data[
-            "source"
-        ] = f"https://reddit.com/r/{subreddit_name}/{submission_id}"
+        submission_data["source"] = f"{SOURCE_PREFIX}{subreddit_name}/{submission_id}"
 
         submission_data["category"] = category
         submission_data["sub_category"] = sub_category
         submission_data["tags"] = row[category]
 
-        db_df = pd.DataFrame(data=[submission_data])
-        print(f"Writing item {count + 1} out of {top_n} to the DB")
-
-        db_df.to_sql(
-            name=TABLE_NAME,
-            con=CONNECTION,
-            schema=SCHEMA,
-            if_exists="append",
-            index=False,
-            method="multi",
-        )
+        rows.append(submission_data)
+        print(f"Accepted item {count + 1} out of {top_n} for the DB")
 
         count += 1
-        if count == top_n:
-            break
 
 
+@timed("get_data_and_write_to_db")
 def get_data_and_write_to_db(year, month, day, time):
-    input_path = f"s3://social-signals-dev-data/reddit/year={year}/month={month}/day={day}/time={time}/combined.csv"
-    df = pd.read_csv(input_path)
-    df = df.sort_values(by=["social_signals_rank"], ascending=False)
+    if is_partition_written(year, month, day, time, source_prefix=SOURCE_PREFIX):
+        print("Rows for this run are already in the DB; skipping...")
+        return
+
+    # Combined data is already sorted by social_signals_rank
+    partition_path = get_partition_path(year, month, day, time)
+    input_path = get_object_path(partition_path, COMBINED_NAME)
+    columns = [
+        "subreddit_name",
+        "submission_id",
+        "submission_title",
+        "sub_category",
+        "social_signals_rank",
+    ] + list(CATEGORIES)
+    df = read_df(input_path, columns=columns)
     print(f"Shape of the combined df is {df.shape}")
 
-    submission_ids = []
-    for category in CATEGORIES:
-        for sub_category in SUB_CATEGORIES:
-            filter_and_write_to_db(
-                year,
-                month,
-                day,
-                time,
-                df,
-                submission_ids,
-                category=category,
-                sub_category=sub_category,
-            )
+    category_index = get_category_index(df)
+    submission_ids, rows = set(), []
+    with get_summary_pool() as summary_pool:
+        for category in CATEGORIES:
+            for sub_category in SUB_CATEGORIES:
+                filter_and_write_to_db(
+                    year,
+                    month,
+                    day,
+                    time,
+                    category_index,
+                    submission_ids,
+                    rows,
+                    summary_pool,
+                    category=category,
+                    sub_category=sub_category,
+                )
+    print_summary_stats()
+
+    write_rows_to_db(rows)
 
 
 def main():
@@ -117,6 +171,9 @@ def main():
     time = given_date.strftime("%H%M%S")
 
     get_data_and_write_to_db(year, month, day, time)
+    sync_inference_cache(compact=True)
+    print_reddit_stats()
+    write_run_report(get_partition_path(year, month, day, time), task="write_to_db")
     print(
         f"Finished writing Reddit Signals to DB for year {year}, month {month}, day={day}, and time={time}"
     )
@@ -1,28 +1,88 @@
 import os
+import threading
 
 import praw
-from praw.models import MoreComments
+from constants import (
+    COMMENT_FETCH_FACTOR,
+    RATE_LIMITER_URL,
+    REDDIT_POOL_SIZE,
+    REDDIT_REQUESTS_BURST,
+    REDDIT_REQUESTS_PER_MINUTE,
+)
+from enrichment import SourceAdapter, get_items_data, process_item_data
+from metrics import timed, timed_block
+from praw.endpoints import API_PATH
+from praw.models import Comment, MoreComments
+from rate_limiter import RateLimiter, get_rate_limiter_backend
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+REDDIT_STATS = {"clients_created": 0, "clients_reused": 0}
+
+# Shared by all the tasks using the same OAuth client, depending on the backend
+REDDIT_RATE_LIMITER = RateLimiter(
+    rate_per_minute=REDDIT_REQUESTS_PER_MINUTE,
+    capacity=REDDIT_REQUESTS_BURST,
+    backend=get_rate_limiter_backend(RATE_LIMITER_URL),
+    key="reddit",
+)
+
+# Reddit expands at most 100 "load more comments" children per request
+MORE_COMMENTS_LIMIT = 100
+
+_REDDIT_LOCK = threading.Lock()
+_REDDIT = None
+
+
+class RateLimitedSession(Session):
+    # Every request to Reddit, from any thread, goes through the shared limiter
+    def request(self, *args, **kwargs):
+        REDDIT_RATE_LIMITER.acquire()
+        with timed_block("reddit.request"):
+            return super().request(*args, **kwargs)
+
+
+def get_http_session():
+    # Keep-alive connections to reddit.com and oauth.reddit.com are pooled
+    session = RateLimitedSession()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=REDDIT_POOL_SIZE)
+    session.mount("https://", adapter)
+
+    return session
 
-from common_tools.common_constants import CLASSIFICATION_THRESHOLD, NONE_FILLER
-from common_tools.sagemaker_inference import get_categories, get_emotion, get_ner
-from common_tools.sumy_summary import get_sumy_summary
 
-config = eval(os.environ["config"])
-REDDIT_ID = config["reddit_id"]
-REDDIT_SECRET = config["reddit_secret"]
-REDDIT_USERNAME = config["reddit_username"]
-REDDIT_PASSWORD = config["reddit_password"]
+def get_reddit():
+    """
+    Returns the process-wide Reddit client. The client keeps its OAuth token and
+    HTTP session, and only fetches a new token once the current one has expired.
+    """
+    global _REDDIT
+
+    with _REDDIT_LOCK:
+        if _REDDIT is None:
+            # Credentials are only read once a client is needed
+            config = eval(os.environ["config"])
+            _REDDIT = praw.Reddit(
+                user_agent="SocialSignals/1.0",
+                client_id=config["reddit_id"],
+                client_secret=config["reddit_secret"],
+                username=config["reddit_username"],
+                password=config["reddit_password"],
+                requestor_kwargs={"session": get_http_session()},
+            )
+            REDDIT_STATS["clients_created"] += 1
+        else:
+            REDDIT_STATS["clients_reused"] += 1
 
+    return _REDDIT
 
-def get_reddit():
-    reddit = praw.Reddit(
-        user_agent="SocialSignals/1.0",
-        client_id=REDDIT_ID,
-        client_secret=REDDIT_SECRET,
-        username=REDDIT_USERNAME,
-        password=REDDIT_PASSWORD,
+
+def print_reddit_stats():
+    clients_reused = REDDIT_STATS["clients_reused"]
+    print(
+        f"Created {REDDIT_STATS['clients_created']} Reddit client(s) and reused them "
+        f"{clients_reused} times, saving up to {clients_reused} OAuth round trips"
     )
-    return reddit
 
 
 def get_subreddit(subreddit_name):
@@ -42,97 +102,69 @@ def get_top_submissions(subreddit_name, time_filter="day"):
     return subreddit, top_submissions
 
 
-def get_comments(submission, comment_sort="top"):
+def get_comments(submission_id, comment_sort="top", limit=100):
     """
+    Yields the top-level comments of a submission lazily. Reddit is only asked for
+    the first limit top-level comments (depth 1), and "load more comments" stubs
+    are only expanded, MORE_COMMENTS_LIMIT at a time, once the comments before them
+    have been consumed.
     comment_sort: Can be one of: "confidence", "controversial", "new", "old", "q&a", and "top"
     """
-    # Calling replace_more() access comments, and so must be done after comment_sort is updated
-    submission.comment_sort = comment_sort
+    reddit = get_reddit()
+    submission_fullname = f"t3_{submission_id}"
+
+    _, top_level_comments = reddit.get(
+        API_PATH["submission"].format(id=submission_id),
+        params={"limit": limit, "sort": comment_sort, "depth": 1},
+    )
+    for top_level_comment in top_level_comments:
+        if not isinstance(top_level_comment, MoreComments):
+            yield top_level_comment
+            continue
+
+        children = top_level_comment.children
+        for i in range(0, len(children), MORE_COMMENTS_LIMIT):
+            more_comments = reddit.post(
+                API_PATH["morechildren"],
+                data={
+                    "api_type": "json",
+                    "children": ",".join(children[i : i + MORE_COMMENTS_LIMIT]),
+                    "link_id": submission_fullname,
+                    "sort": comment_sort,
+                    "depth": 1,
+                },
+            )
+            for more_comment in more_comments:
+                if (
+                    isinstance(more_comment, Comment)
+                    and more_comment.parent_id == submission_fullname
+                ):
+                    yield more_comment
+
+
+def get_candidate_comments(top_level_comments):
+    for top_level_comment in top_level_comments:
+        # We don't want stickied comments- mostly from Mods
+        if top_level_comment.stickied:
+            print("Found stickied comment; skipping...")
+            continue
 
-    # Remove comments like "load more comments”, and “continue this thread”
-    submission.comments.replace_more(limit=0)
+        # We don't want comments from bots
+        comment_author = top_level_comment.author
+        if comment_author:
+            if "bot" in comment_author.name.lower():
+                print(f"Found comment from bot {comment_author}; skipping...")
+                continue
 
-    comments = submission.comments
-    return comments
+        yield top_level_comment.body
 
 
-def get_submission_data(subreddit, submission):
-    submission_data = {}
-
-    subreddit_name = subreddit.display_name
-    submission_data["subreddit_name"] = subreddit_name
-
-    submission_id = submission.id
-    submission_data["submission_id"] = submission_id
-
-    submission_title = submission.title
-    submission_data["submission_title"] = submission_title
-    print(f"Submission title: {submission_title}")
-
-    # Don't include live threads
-    if "Live Thread" in submission_title:
-        print(f"Quitting live thread: {submission_title}")
-        return
-
-    print("Getting entities for the title...")
-    entities = get_ner(submission_title)
-    organization, person, location = [], [], []
-    if isinstance(entities, list):
-        for entity in entities:
-            # TO DO: Find better fix if word is corrupted due to tokenization
-            word = entity["word"]
-            if (
-                entity["entity_group"] == "ORG"
-                and entity["score"] >= CLASSIFICATION_THRESHOLD
-            ):
-                if "#" not in word and len(word) >= 2:
-                    organization.append(entity["word"])
-            if (
-                entity["entity_group"] == "PER"
-                and entity["score"] >= CLASSIFICATION_THRESHOLD
-            ):
-                if "#" not in word and len(word) >= 2:
-                    person.append(entity["word"])
-            if (
-                entity["entity_group"] == "LOC"
-                and entity["score"] >= CLASSIFICATION_THRESHOLD
-            ):
-                if "#" not in word and len(word) >= 2:
-                    location.append(entity["word"])
-
-    if not (organization + person + location):
-        print("Expected entities not found. Quitting...")
-        return
-
-    if organization:
-        submission_data["Organization"] = ", ".join(organization)
-    else:
-        submission_data["Organization"] = NONE_FILLER
-    if person:
-        submission_data["Person"] = ", ".join(person)
-    else:
-        submission_data["Person"] = NONE_FILLER
-    if location:
-        submission_data["Location"] = ", ".join(location)
-    else:
-        submission_data["Location"] = NONE_FILLER
-
-    print("Getting sub-category for the title...")
-    sub_category = get_categories(submission_title)
-    if isinstance(sub_category, dict):
-        title_sub_category_label = sub_category["labels"][0]
-        title_sub_category_score = sub_category["scores"][0]
-
-        if title_sub_category_score >= 0.25:
-            submission_data["sub_category"] = title_sub_category_label
-        else:
-            submission_data["sub_category"] = "Miscellaneous"
-    else:
-        submission_data["sub_category"] = "Miscellaneous"
+def get_submission_stats(submission):
+    submission_stats = {}
 
     # The number of upvotes for the submission
     submission_up_votes = submission.score
-    submission_data["submission_up_votes_count"] = submission_up_votes
+    submission_stats["submission_up_votes_count"] = submission_up_votes
 
     # The percentage of upvotes from all votes on the submission
     submission_upvote_ratio = submission.upvote_ratio
@@ -141,93 +173,81 @@ def get_submission_data(subreddit, submission):
     # Let's assume 5% of the people vote
     # This should be sub-reddit dependent but for now, we will generalize it
     submission_all_votes_count = submission_up_votes / submission_upvote_ratio
-    submission_data["submission_views_count"] = 20 * submission_all_votes_count
+    submission_stats["submission_views_count"] = 20 * submission_all_votes_count
 
     # The number of comments on the submission
     submission_num_comments = submission.num_comments
-    submission_data["submission_comments_count"] = submission_num_comments
-
-    return submission_data
+    submission_stats["submission_comments_count"] = submission_num_comments
 
+    return submission_stats
 
-def process_submission_data(
-    submission_id, submission_title, comment_sort="top", comment_limit=10
-):
-    reddit = get_reddit()
-    submission = reddit.submission(submission_id)
-
-    submission_data = {}
-
-    print("Getting emotion for the title...")
-    title_emotion = get_emotion(submission_title)
-    if isinstance(title_emotion, list):
-        if title_emotion:
-            title_emotion = title_emotion[0]
-            title_emotion_prediction = title_emotion["label"]
-            title_emotion_score = title_emotion["score"]
-            if title_emotion_score >= CLASSIFICATION_THRESHOLD:
-                submission_data["title_emotion"] = title_emotion_prediction
-            else:
-                submission_data["title_emotion"] = "neutral"
-
-    print("Going over comments...")
-    comment_count = 0
-    top_level_comments = get_comments(submission=submission, comment_sort=comment_sort)
-    comments_emotion_counter, comments = {}, []
-    for top_level_comment in top_level_comments:
-        if isinstance(top_level_comment, MoreComments):
-            continue
 
-        # We don't want stickied comments- mostly from Mods
-        if top_level_comment.stickied:
-            print("Found stickied comment; skipping...")
-            continue
+class RedditAdapter(SourceAdapter):
+    id_column = "submission_id"
+    title_column = "submission_title"
 
-        # We don't want comments from bots
-        comment_author = top_level_comment.author
-        if comment_author:
-            if "bot" in comment_author.name.lower():
-                print(f"Found comment from bot {comment_author}; skipping...")
-                continue
+    def __init__(self, subreddit=None, comment_sort="top"):
+        self.subreddit = subreddit
+        self.comment_sort = comment_sort
 
-        comment = top_level_comment.body
-        comment_emotion = get_emotion(comment)
+    def get_item_id(self, submission):
+        return submission.id
 
-        if isinstance(comment_emotion, list):
-            if comment_emotion:
-                comment_emotion = comment_emotion[0]
-                comment_emotion_prediction = comment_emotion["label"]
+    def get_item_title(self, submission):
+        return submission.title
 
-                # Neutral is abundant and not interesting
-                if comment_emotion_prediction == "neutral":
-                    continue
+    def is_candidate(self, submission):
+        # Don't include live threads
+        if "Live Thread" in submission.title:
+            print(f"Quitting live thread: {submission.title}")
+            return False
 
-                comment_emotion_score = comment_emotion["score"]
-                comment_emotion_score = round(comment_emotion_score, 2)
-                if comment_emotion_score < CLASSIFICATION_THRESHOLD:
-                    continue
+        return True
 
-                comments_emotion_counter[comment_emotion_prediction] = (
-                    comments_emotion_counter.get(comment_emotion_prediction, 0) + 1
-                )
+    def get_item_fields(self, submission):
+        return {"subreddit_name": self.subreddit.display_name}
 
-        comments.append(comment)
-        comment_count += 1
-        if comment_count == comment_limit:
-            break
-    print(f"Found {len(comments)} comments")
+    def get_item_stats(self, submission):
+        return get_submission_stats(submission)
 
-    if comments_emotion_counter:
-        submission_data["comments_emotion"] = max(
-            comments_emotion_counter, key=comments_emotion_counter.get
+    def get_item_comments(self, submission_id, comment_limit):
+        # Some comments are filtered out, so a few more than needed are requested
+        top_level_comments = get_comments(
+            submission_id=submission_id,
+            comment_sort=self.comment_sort,
+            limit=COMMENT_FETCH_FACTOR * comment_limit,
         )
-    else:
-        submission_data["comments_emotion"] = "neutral"
+        return get_candidate_comments(top_level_comments)
+
+
+@timed("get_submissions_data")
+def get_submissions_data(subreddit, submissions, enrichment_state=None):
+    """
+    Batched version of get_submission_data, see enrichment.get_items_data.
+    """
+    return get_items_data(
+        RedditAdapter(subreddit), submissions, enrichment_state=enrichment_state
+    )
 
-    if comments:
-        summary = get_sumy_summary(comments)
-        submission_data["comments_summary"] = summary
-    else:
-        submission_data["comments_summary"] = NONE_FILLER
 
-    return submission_data
+def get_submission_data(subreddit, submission):
+    submissions_data = get_submissions_data(subreddit, [submission])
+    if submissions_data:
+        return submissions_data[0]
+
+
+@timed("process_submission_data")
+def process_submission_data(
+    submission_id,
+    submission_title,
+    comment_sort="top",
+    comment_limit=10,
+    summarize=True,
+):
+    return process_item_data(
+        RedditAdapter(comment_sort=comment_sort),
+        submission_id,
+        submission_title,
+        comment_limit,
+        summarize=summarize,
+    )
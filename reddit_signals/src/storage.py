@@ -0,0 +1,239 @@
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import fsspec
+import pandas as pd
+from constants import (
+    DATA_FORMAT,
+    DATA_LOCATION,
+    READ_WORKERS,
+    STORAGE_CACHE_DIR,
+    STORAGE_CACHE_MAX_BYTES,
+)
+from metrics import increment, timed
+
+COMBINED_NAME = "combined"
+
+# Backends that are read directly, as a local copy wouldn't be faster
+UNCACHED_PROTOCOLS = {"file", "local", "memory"}
+
+
+def get_partition_path(year, month, day, time):
+    return f"{DATA_LOCATION}/year={year}/month={month}/day={day}/time={time}"
+
+
+def get_object_path(partition_path, name, data_format=DATA_FORMAT):
+    """
+    data_format: Can be one of: "csv" or "parquet"
+    """
+    return f"{partition_path}/{name}.{data_format}"
+
+
+def list_source_objects(partition_path, data_format=DATA_FORMAT):
+    """
+    Returns the per-source objects of the partition, i.e. all but the combined one.
+    """
+    fs, _ = fsspec.core.url_to_fs(partition_path)
+    paths = fs.glob(f"{partition_path}/*.{data_format}")
+    combined_file_name = f"{COMBINED_NAME}.{data_format}"
+
+    return [
+        fs.unstrip_protocol(path)
+        for path in sorted(paths)
+        if path.rsplit("/", 1)[-1] != combined_file_name
+    ]
+
+
+@timed("storage.write_df")
+def write_df(df, partition_path, name, data_format=DATA_FORMAT):
+    output_path = get_object_path(partition_path, name, data_format)
+    print(f"Writing output to {output_path}")
+
+    # No-op on object stores; local directories have to exist before writing
+    fs, fs_path = fsspec.core.url_to_fs(partition_path)
+    fs.makedirs(fs_path, exist_ok=True)
+
+    if data_format == "parquet":
+        df.to_parquet(output_path, index=False, compression="zstd")
+    else:
+        df.to_csv(output_path, index=False)
+
+    return output_path
+
+
+def parse_df(path, file, columns=None):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(file, columns=columns)
+
+    return pd.read_csv(file, usecols=columns)
+
+
+def is_cached_backend(fs):
+    protocols = fs.protocol if isinstance(fs.protocol, tuple) else (fs.protocol,)
+    return not UNCACHED_PROTOCOLS.intersection(protocols)
+
+
+def get_object_version(info):
+    """
+    Returns the version of an object from its listing: its ETag on S3, and its
+    size and modification time on backends without ETags.
+    """
+    etag = info.get("ETag") or info.get("etag")
+    if etag:
+        return etag.strip('"')
+
+    modified_at = info.get("LastModified") or info.get("mtime") or info.get("created")
+    return f"{info.get('size')}-{modified_at}"
+
+
+def get_objects_version(fs, fs_paths):
+    # One fresh listing per directory, so that rewritten objects are noticed
+    versions = {}
+    for directory in sorted({fs_path.rsplit("/", 1)[0] for fs_path in fs_paths}):
+        fs.invalidate_cache(directory)
+        for info in fs.ls(directory, detail=True):
+            versions[info["name"]] = get_object_version(info)
+
+    return {fs_path: versions.get(fs_path) for fs_path in fs_paths}
+
+
+def get_cache_path(fs_path, version):
+    key = hashlib.sha256(f"{fs_path}:{version}".encode("utf-8")).hexdigest()
+    return os.path.join(STORAGE_CACHE_DIR, key)
+
+
+def read_cached_content(cache_path):
+    try:
+        with open(cache_path, "rb") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return
+
+    # Recently read objects are evicted last
+    os.utime(cache_path)
+    return content
+
+
+def write_cached_content(cache_path, content):
+    # Written under a temporary name first, so that readers never see partial files
+    os.makedirs(STORAGE_CACHE_DIR, exist_ok=True)
+    temporary_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(content)
+    os.replace(temporary_path, cache_path)
+
+
+def evict_storage_cache():
+    entries = []
+    for entry in os.scandir(STORAGE_CACHE_DIR):
+        if entry.name.endswith(".tmp"):
+            continue
+        stat = entry.stat()
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    cache_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if cache_size <= STORAGE_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        cache_size -= size
+
+
+def cat_objects(paths):
+    """
+    Fetches the content of objects concurrently in one batch (async for S3), as a
+    dict keyed by path; objects that couldn't be fetched map to their exception.
+    Objects of remote backends are served from the local cache unless their
+    version changed since they were cached.
+    """
+    fs, _ = fsspec.core.url_to_fs(paths[0])
+    fs_paths = {path: fsspec.core.url_to_fs(path)[1] for path in paths}
+
+    if not is_cached_backend(fs):
+        contents = fs.cat(list(fs_paths.values()), on_error="return")
+        return {path: contents.get(fs_path) for path, fs_path in fs_paths.items()}
+
+    versions = get_objects_version(fs, list(fs_paths.values()))
+    contents, missing, hits_count = {}, {}, 0
+    for path, fs_path in fs_paths.items():
+        version = versions[fs_path]
+        if version is None:
+            contents[path] = FileNotFoundError(path)
+            continue
+
+        cache_path = get_cache_path(fs_path, version)
+        content = read_cached_content(cache_path)
+        if content is None:
+            missing[path] = cache_path
+        else:
+            contents[path] = content
+            hits_count += 1
+
+    increment("storage.cache.hits", hits_count)
+    increment("storage.cache.misses", len(missing))
+    if missing:
+        fetched = fs.cat([fs_paths[path] for path in missing], on_error="return")
+        written = False
+        for path, cache_path in missing.items():
+            content = fetched.get(fs_paths[path])
+            if isinstance(content, bytes):
+                write_cached_content(cache_path, content)
+                written = True
+            contents[path] = content
+
+        # Nothing to evict, nor maybe a cache directory, when every fetch failed
+        if written:
+            evict_storage_cache()
+
+    return contents
+
+
+@timed("storage.read_df")
+def read_df(path, columns=None):
+    """
+    Reads a partition object; only the given columns are loaded when set.
+    """
+    content = cat_objects([path])[path]
+    if content is None or isinstance(content, Exception):
+        raise content or FileNotFoundError(path)
+
+    return parse_df(path, io.BytesIO(content), columns=columns)
+
+
+@timed("storage.read_dfs")
+def read_dfs(paths, columns=None, workers=READ_WORKERS):
+    """
+    Fetches the objects with cat_objects and parses them in a thread pool. Objects
+    that couldn't be fetched or parsed are skipped; the other frames are returned in
+    the order of paths.
+    """
+    if not paths:
+        return []
+
+    contents = cat_objects(paths)
+
+    def parse_content(path):
+        content = contents.get(path)
+        if content is None or isinstance(content, Exception):
+            print(f"Couldn't read file {path} due to exception\n{content}; skipping...")
+            increment("storage.read_dfs.skipped")
+            return
+
+        try:
+            return parse_df(path, io.BytesIO(content), columns=columns)
+        except Exception as e:
+            print(
+                f"Couldn't parse file {path} as df due to exception\n{e}; skipping..."
+            )
+            increment("storage.read_dfs.skipped")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        dfs = list(executor.map(parse_content, paths))
+
+    return [df for df in dfs if df is not None]
@@ -0,0 +1,97 @@
+import heapq
+from collections import defaultdict
+from itertools import count
+
+import numpy as np
+import pandas as pd
+from constants import COMBINE_CHUNK_SIZE, COMBINE_TOP_N
+from metrics import increment
+from storage import read_dfs
+
+from common_tools.common_constants import CATEGORIES, NONE_FILLER
+
+RANK_COLUMN = "social_signals_rank"
+
+
+def compact_dtypes(df, categorical_columns):
+    """
+    Labels repeated across rows are stored as categoricals, and ranks as float32.
+    """
+    for column in categorical_columns:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+
+    for column in df.columns:
+        if column.endswith("_rank"):
+            df[column] = df[column].astype(np.float32)
+
+    return df
+
+
+def get_rank_key(rank):
+    # Rows without a rank are kept last, like in a full sort
+    return rank if rank == rank else -np.inf
+
+
+def update_top_buckets(buckets, df, top_n, sequence, chunk=0):
+    """
+    Pushes the rows of df into the min-heaps of their (category, sub_category)
+    buckets; a bucket never holds more than its top_n rows seen so far. Rows are
+    keyed by chunk and index, as a row can be in many buckets.
+    """
+    for category in CATEGORIES:
+        tagged_df = df[df[category] != NONE_FILLER]
+        for sub_category, group_df in tagged_df.groupby("sub_category", observed=True):
+            heap = buckets[(category, sub_category)]
+            group_df = group_df.sort_values(
+                RANK_COLUMN, ascending=False, na_position="last"
+            ).head(top_n)
+
+            rows = zip(group_df.index, group_df.to_dict("records"))
+            for index, row in rows:
+                # The sequence keeps rows with the same rank from being compared
+                rank_key = get_rank_key(row[RANK_COLUMN])
+                entry = (rank_key, next(sequence), (chunk, index), row)
+                if len(heap) < top_n:
+                    heapq.heappush(heap, entry)
+                elif entry[0] > heap[0][0]:
+                    heapq.heappushpop(heap, entry)
+
+
+def get_streamed_top_df(
+    paths,
+    get_ranked_df,
+    categorical_columns,
+    top_n=COMBINE_TOP_N,
+    chunk_size=COMBINE_CHUNK_SIZE,
+):
+    """
+    Out-of-core version of concatenating and ranking all the per-source objects:
+    they are read chunk_size at a time, ranked with get_ranked_df, and only the
+    top_n rows of every (category, sub_category) are kept. A row in many buckets
+    is returned once; the returned df isn't sorted.
+    """
+    buckets, sequence = defaultdict(list), count()
+    columns, rows_count = None, 0
+    for i in range(0, len(paths), chunk_size):
+        dfs = read_dfs(paths[i : i + chunk_size])
+        if not dfs:
+            continue
+
+        df = get_ranked_df(pd.concat(dfs, ignore_index=True))
+        df = compact_dtypes(df, categorical_columns)
+        if columns is None:
+            columns = list(df.columns)
+        rows_count += len(df)
+
+        update_top_buckets(buckets, df, top_n, sequence, chunk=i)
+
+    if columns is None:
+        raise ValueError(f"Couldn't read any of the {len(paths)} files")
+
+    rows = {key: row for heap in buckets.values() for _, _, key, row in heap}
+    increment("combine.rows_read", rows_count)
+    increment("combine.rows_kept", len(rows))
+    print(f"Kept {len(rows)} out of {rows_count} rows in {len(buckets)} buckets")
+
+    return pd.DataFrame(list(rows.values()), columns=columns)
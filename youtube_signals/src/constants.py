@@ -1,9 +1,92 @@
+import os
+
 # Weights for Social Signals rank
 LIKE_WEIGHT = 0.25
 COMMENT_WEIGHT = 0.75
+# Weight of the velocity rank; 0 keeps the Social Signals rank a single snapshot
+VELOCITY_WEIGHT = 0.0
 
 # For video data
 VIDEO_LIMIT = 20
+# The most popular chart of a category has at most 200 videos, 50 per page
+VIDEO_PAGE_SIZE = 50
+VIDEO_MAX_PAGES = 4
+
+# For YouTube client
+# Default quota of a project, reset daily
+YOUTUBE_QUOTA_UNITS_PER_DAY = 10000
+YOUTUBE_QUOTA_UNITS_BURST = 500
+# Quota cost of a call, per method
+YOUTUBE_UNIT_COSTS = {"videos.list": 1, "commentThreads.list": 1}
+# Longest wait for quota before a call that can't be shed gives up
+YOUTUBE_QUOTA_MAX_WAIT_SECONDS = 60
+
+# For rate limiting API calls
+# Where the token buckets live; can be one of: "memory://" for a single process,
+# "file:///path/to/directory" for the processes of a host, or "redis://host:port/db"
+# to share them across all the tasks using the same credentials
+RATE_LIMITER_URL = os.environ.get("RATE_LIMITER_URL", "memory://")
+COUNT_COLUMNS = ["video_view_count", "video_like_count", "video_comment_count"]
 
 # For comments data
 COMMENT_LIMIT = 20
+# Number of candidate videos whose comments are fetched in one batch
+COMMENT_PREFETCH_SIZE = 6
+
+# For incremental runs
+# Enrichment results of an id are reused for this many days
+ENRICHMENT_STATE_TTL_DAYS = 7
+# Counter snapshots kept per id, enough for velocity and acceleration
+COUNTER_SNAPSHOTS = 3
+COUNTER_STATE_TTL_DAYS = 7
+# Run objects of counter snapshots merged together once there are more of them
+COUNTER_STATE_COMPACT_OBJECTS = 24
+
+# For SageMaker inference
+# Number of comments classified together before the usable ones are counted
+INFERENCE_BATCH_SIZE = 10
+# Number of requests in flight across all the callers of a process
+INFERENCE_WORKERS = 20
+
+# For inference cache shared across runs
+# Both can be overridden, e.g. to run against a local directory
+INFERENCE_CACHE_PATH = os.environ.get(
+    "INFERENCE_CACHE_PATH", "/tmp/inference_cache.sqlite"
+)
+# Directory of the compacted cache and of the deltas of the tasks since
+INFERENCE_CACHE_LOCATION = os.environ.get(
+    "INFERENCE_CACHE_LOCATION",
+    "s3://social-signals-dev-data/youtube/_cache/inference_cache",
+)
+INFERENCE_CACHE_TTL_DAYS = 7
+INFERENCE_CACHE_MAX_ENTRIES = 200000
+
+# For writing to the DB
+# Prefix of the source of the rows written by this pipeline
+SOURCE_PREFIX = "https://www.youtube.com/watch?v="
+# Number of rows per multi-row INSERT
+DB_FLUSH_SIZE = 100
+
+# For intermediate data
+# Can be any fsspec URL, e.g. "memory://" or a local directory for offline runs
+DATA_LOCATION = os.environ.get("DATA_LOCATION", "s3://social-signals-dev-data/youtube")
+# Can be one of: "csv" or "parquet"
+DATA_FORMAT = "csv"
+# Number of threads parsing partition objects
+READ_WORKERS = 8
+# Local copies of remote objects, reused while their ETag is unchanged
+STORAGE_CACHE_DIR = os.environ.get("STORAGE_CACHE_DIR", "/tmp/storage_cache")
+STORAGE_CACHE_MAX_BYTES = 1024**3
+
+# For combining the per-source data
+# Can be one of: "full", which ranks all the rows in memory, or "streaming", which
+# ranks them a chunk at a time and keeps the top COMBINE_TOP_N of each bucket
+COMBINE_MODE = "full"
+# Candidates kept per (category, sub_category), above the rows written per bucket
+COMBINE_TOP_N = 50
+# Number of per-source objects read and ranked together when streaming
+COMBINE_CHUNK_SIZE = 16
+
+# For summarization
+# Size of the summary process pool; set to the vCPU count of the task
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", os.cpu_count() or 1))
@@ -0,0 +1,152 @@
+from datetime import datetime, timezone
+
+import fsspec
+import pandas as pd
+from constants import (
+    COUNTER_SNAPSHOTS,
+    COUNTER_STATE_COMPACT_OBJECTS,
+    COUNTER_STATE_TTL_DAYS,
+    DATA_LOCATION,
+)
+from metrics import increment
+from storage import read_dfs, write_df
+
+# Every run adds its own object, named by its observed_at, next to the compacted one
+STATE_LOCATION = f"{DATA_LOCATION}/_state/counters"
+COMPACTED_NAME = "compacted"
+STATE_FORMAT = "parquet"
+
+SECONDS_PER_HOUR = 60 * 60
+
+
+def get_observed_at(year, month, day, time):
+    # Snapshots are timed by the run rather than the clock, so retries match
+    observed_at = datetime.strptime(f"{year}{month}{day}{time}", "%Y%m%d%H%M%S")
+    return observed_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def list_state_objects():
+    """
+    Returns the paths of the compacted object, if any, and of the run objects that
+    weren't compacted yet, oldest first.
+    """
+    fs, _ = fsspec.core.url_to_fs(STATE_LOCATION)
+    paths = fs.glob(f"{STATE_LOCATION}/*.{STATE_FORMAT}")
+    compacted_file_name = f"{COMPACTED_NAME}.{STATE_FORMAT}"
+
+    compacted_paths, run_paths = [], []
+    for path in sorted(paths):
+        if path.rsplit("/", 1)[-1] == compacted_file_name:
+            compacted_paths.append(fs.unstrip_protocol(path))
+        else:
+            run_paths.append(fs.unstrip_protocol(path))
+
+    return compacted_paths, run_paths
+
+
+def read_counter_state(paths, observed_at):
+    # Later objects win, so a run object replaces its rows in the compacted one
+    dfs = read_dfs(paths)
+    if not dfs:
+        return pd.DataFrame(columns=["id", "observed_at"])
+
+    df = pd.concat(dfs, ignore_index=True)
+    df = df.drop_duplicates(["id", "observed_at"], keep="last")
+    expired_at = observed_at - COUNTER_STATE_TTL_DAYS * 24 * SECONDS_PER_HOUR
+
+    return df[df["observed_at"] >= expired_at]
+
+
+def load_counter_state(observed_at):
+    """
+    Returns the counter snapshots of the last runs, with an id, observed_at and
+    counter columns. Snapshots taken more than COUNTER_STATE_TTL_DAYS before
+    observed_at are dropped.
+    """
+    compacted_paths, run_paths = list_state_objects()
+    df = read_counter_state(compacted_paths + run_paths, observed_at)
+    print(
+        f"Loaded {len(df)} counter snapshots from {len(compacted_paths)} compacted "
+        f"and {len(run_paths)} run object(s) in {STATE_LOCATION}"
+    )
+
+    return df
+
+
+def compact_counter_state(observed_at):
+    """
+    Merges the run objects into the compacted one, keeping the latest
+    COUNTER_SNAPSHOTS of every id, and deletes them. A run object left over by an
+    interrupted compaction is merged again by the next one.
+    """
+    compacted_paths, run_paths = list_state_objects()
+    df = read_counter_state(compacted_paths + run_paths, observed_at)
+    df = df.sort_values("observed_at", ascending=False)
+    df = df[df.groupby("id").cumcount() < COUNTER_SNAPSHOTS]
+
+    write_df(df, STATE_LOCATION, name=COMPACTED_NAME, data_format=STATE_FORMAT)
+    fs, _ = fsspec.core.url_to_fs(STATE_LOCATION)
+    fs.rm(run_paths)
+
+    increment("counter_state.compactions")
+    print(f"Compacted {len(run_paths)} run object(s) into {len(df)} snapshots")
+
+
+def save_counter_state(snapshots):
+    """
+    Writes the snapshots of this run as its own object, replacing the one of an
+    earlier attempt, and compacts the state once there are more than
+    COUNTER_STATE_COMPACT_OBJECTS run objects.
+    """
+    if snapshots.empty:
+        return
+
+    observed_at = snapshots["observed_at"].iloc[0]
+    write_df(
+        snapshots, STATE_LOCATION, name=f"{observed_at:.0f}", data_format=STATE_FORMAT
+    )
+
+    _, run_paths = list_state_objects()
+    if len(run_paths) > COUNTER_STATE_COMPACT_OBJECTS:
+        compact_counter_state(observed_at)
+
+
+def get_counter_features(counter_state, df, id_column, counter_columns, observed_at):
+    """
+    Adds {counter}_velocity and {counter}_acceleration columns to df, per hour,
+    from the latest snapshots of its ids before observed_at; they are 0 for ids
+    without enough history. Returns df and its snapshots for save_counter_state.
+    """
+    snapshots = df[[id_column] + counter_columns].drop_duplicates(id_column)
+    snapshots = snapshots.rename(columns={id_column: "id"})
+    for column in counter_columns:
+        snapshots[column] = pd.to_numeric(snapshots[column], errors="coerce")
+    snapshots["observed_at"] = observed_at
+    current = snapshots.set_index("id")
+
+    history = counter_state[
+        (counter_state["observed_at"] < observed_at)
+        & counter_state["id"].isin(current.index)
+    ]
+    history = history.sort_values("observed_at", ascending=False)
+    positions = history.groupby("id").cumcount()
+    previous = history[positions == 0].set_index("id").reindex(current.index)
+    before = history[positions == 1].set_index("id").reindex(current.index)
+
+    hours = (observed_at - previous["observed_at"]) / SECONDS_PER_HOUR
+    previous_hours = (
+        previous["observed_at"] - before["observed_at"]
+    ) / SECONDS_PER_HOUR
+
+    features = pd.DataFrame(index=current.index)
+    for column in counter_columns:
+        if column not in history.columns:
+            velocity = previous_velocity = pd.Series(float("nan"), index=current.index)
+        else:
+            velocity = (current[column] - previous[column]) / hours
+            previous_velocity = (previous[column] - before[column]) / previous_hours
+        features[f"{column}_velocity"] = velocity
+        features[f"{column}_acceleration"] = (velocity - previous_velocity) / hours
+    features = features.astype(float).fillna(0.0)
+
+    return df.join(features, on=id_column), snapshots
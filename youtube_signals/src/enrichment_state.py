@@ -0,0 +1,71 @@
+import time
+
+import pandas as pd
+from constants import DATA_LOCATION, ENRICHMENT_STATE_TTL_DAYS
+from storage import read_df, write_df
+
+STATE_LOCATION = f"{DATA_LOCATION}/_state/enrichment"
+
+# Title inference results kept for every enriched id
+ENRICHMENT_COLUMNS = ["Organization", "Person", "Location", "sub_category"]
+
+
+def load_enrichment_state(name):
+    """
+    Returns the enrichment state of name, e.g. a subreddit or a video category, as
+    a dict keyed by id. Entries older than ENRICHMENT_STATE_TTL_DAYS are dropped.
+    """
+    state_path = f"{STATE_LOCATION}/{name}.parquet"
+    try:
+        df = read_df(state_path)
+    except FileNotFoundError:
+        print(f"Didn't find enrichment state at {state_path}")
+        return {}
+    except Exception as e:
+        print(f"Couldn't read enrichment state due to exception\n{e}")
+        return {}
+
+    expired_at = time.time() - ENRICHMENT_STATE_TTL_DAYS * 24 * 60 * 60
+    df = df[df["enriched_at"] >= expired_at]
+    df = df.astype(object).where(df.notna(), None)
+    print(f"Loaded enrichment state of {len(df)} ids from {state_path}")
+
+    return {record["id"]: record for record in df.to_dict("records")}
+
+
+def save_enrichment_state(name, enrichment_state):
+    if not enrichment_state:
+        return
+
+    df = pd.DataFrame(list(enrichment_state.values()))
+
+    # Counters can come as strings from the APIs
+    text_columns = ["id", "title"] + ENRICHMENT_COLUMNS
+    for column in df.columns.difference(text_columns):
+        try:
+            df[column] = pd.to_numeric(df[column])
+        except (TypeError, ValueError):
+            pass
+    write_df(df, STATE_LOCATION, name=name, data_format="parquet")
+
+
+def is_enriched(enrichment_state, item_id, title):
+    # Titles can be edited, in which case the item is enriched again
+    enrichment = enrichment_state.get(item_id)
+    return enrichment is not None and enrichment["title"] == title
+
+
+def set_enrichment(enrichment_state, item_id, title, title_entities, sub_category):
+    """
+    Records the title inference results of an item; title_entities is None for
+    items without expected entities, which are not enriched again either.
+    """
+    enrichment = {"id": item_id, "title": title, "enriched_at": time.time()}
+    enrichment["accepted"] = title_entities is not None
+    for column in ENRICHMENT_COLUMNS:
+        enrichment[column] = None
+    if title_entities is not None:
+        enrichment.update(title_entities)
+        enrichment["sub_category"] = sub_category
+
+    enrichment_state[item_id] = enrichment
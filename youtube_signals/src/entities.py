@@ -0,0 +1,51 @@
+import pandas as pd
+
+from common_tools.common_constants import CLASSIFICATION_THRESHOLD, NONE_FILLER
+
+# NER entity groups and the columns they are written to
+ENTITY_COLUMNS = {"ORG": "Organization", "PER": "Person", "LOC": "Location"}
+
+
+def get_titles_entities(titles_ner):
+    """
+    Post-processes the NER output of many titles at once: the entities are flattened
+    into one table, filtered on score and token fragments, and joined back per title.
+    Returns, for every title, its Organization, Person and Location strings, or None
+    if no expected entity was found.
+    """
+    titles_entities = [None] * len(titles_ner)
+
+    records = [
+        (title_index, entity["entity_group"], entity["score"], entity["word"])
+        for title_index, entities in enumerate(titles_ner)
+        if isinstance(entities, list)
+        for entity in entities
+    ]
+    df = pd.DataFrame.from_records(
+        records, columns=["title_index", "entity_group", "score", "word"]
+    )
+
+    # TO DO: Find better fix if word is corrupted due to tokenization
+    df = df[
+        df["entity_group"].isin(list(ENTITY_COLUMNS))
+        & (df["score"] >= CLASSIFICATION_THRESHOLD)
+        & ~df["word"].astype(str).str.contains("#", regex=False)
+        & (df["word"].astype(str).str.len() >= 2)
+    ]
+    if df.empty:
+        return titles_entities
+
+    df_entities = (
+        df.groupby(["title_index", "entity_group"], sort=False)["word"]
+        .agg(", ".join)
+        .unstack("entity_group")
+        .reindex(columns=list(ENTITY_COLUMNS))
+        .rename(columns=ENTITY_COLUMNS)
+        .fillna(NONE_FILLER)
+    )
+    for title_index, title_entities in zip(
+        df_entities.index, df_entities.to_dict("records")
+    ):
+        titles_entities[title_index] = title_entities
+
+    return titles_entities
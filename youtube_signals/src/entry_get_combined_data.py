@@ -3,28 +3,31 @@ from datetime import datetime
 
 import numpy as np
 import pandas as pd
-import s3fs
-from constants import COMMENT_WEIGHT, LIKE_WEIGHT
-
-
-def get_combined_data(year, month, day, time):
-    s3 = s3fs.S3FileSystem(anon=False)
-
-    files_location = f"s3://social-signals-dev-data/youtube/year={year}/month={month}/day={day}/time={time}/*.csv"
-    files = s3.glob(files_location)
-    print(f"Processing files {files}")
-
-    dfs = []
-    for file in files:
-        try:
-            df = pd.read_csv(f"s3://{file}")
-        except Exception as e:
-            print(f"Couldn't read file {file} as df due to exception\n{e}")
-        dfs.append(df)
-
-    df = pd.concat(dfs, ignore_index=True)
-    print(f"Shape of the final dataframe is {df.shape}")
-
+from combine import get_streamed_top_df
+from constants import (
+    COMBINE_MODE,
+    COMMENT_WEIGHT,
+    COUNT_COLUMNS,
+    LIKE_WEIGHT,
+    VELOCITY_WEIGHT,
+)
+from counter_state import (
+    get_counter_features,
+    get_observed_at,
+    load_counter_state,
+    save_counter_state,
+)
+from metrics import timed, write_run_report
+from storage import (
+    COMBINED_NAME,
+    get_partition_path,
+    list_source_objects,
+    read_dfs,
+    write_df,
+)
+
+
+def get_ranked_df(df):
     print("Calculating like rank")
     df["like_rank"] = (
         df["video_like_count"]
@@ -39,16 +42,65 @@ def get_combined_data(year, month, day, time):
         .replace(np.inf, 0.0)
     )
 
+    # Counters gained per hour since the last run, relative to the views
+    print("Calculating velocity rank")
+    df["velocity_rank"] = (
+        (
+            (LIKE_WEIGHT * df["video_like_count_velocity"])
+            + (COMMENT_WEIGHT * df["video_comment_count_velocity"])
+        )
+        .div(df["video_view_count"])
+        .replace([np.inf, -np.inf], 0.0)
+        .fillna(0.0)
+    )
+
     print("Calculating Social Signals rank")
-    df["social_signals_rank"] = (LIKE_WEIGHT * df["like_rank"]) + (
-        COMMENT_WEIGHT * df["comment_rank"]
+    df["social_signals_rank"] = (
+        (LIKE_WEIGHT * df["like_rank"])
+        + (COMMENT_WEIGHT * df["comment_rank"])
+        + (VELOCITY_WEIGHT * df["velocity_rank"])
     )
 
+    return df
+
+
+@timed("get_combined_data")
+def get_combined_data(year, month, day, time, mode=COMBINE_MODE):
+    """
+    mode: Can be one of: "full" or "streaming", see COMBINE_MODE
+    """
+    partition_path = get_partition_path(year, month, day, time)
+    files = list_source_objects(partition_path)
+    print(f"Processing files {files}")
+
+    # Velocity features come from the snapshots of the last runs, not their data
+    observed_at = get_observed_at(year, month, day, time)
+    counter_state = load_counter_state(observed_at)
+    snapshots = []
+
+    def get_featured_ranked_df(df):
+        df, df_snapshots = get_counter_features(
+            counter_state, df, "video_id", COUNT_COLUMNS, observed_at
+        )
+        snapshots.append(df_snapshots)
+        return get_ranked_df(df)
+
+    if mode == "streaming":
+        df = get_streamed_top_df(
+            files, get_featured_ranked_df, categorical_columns=["sub_category"]
+        )
+    else:
+        dfs = read_dfs(files)
+        print(f"Read {len(dfs)} out of {len(files)} files")
+
+        df = pd.concat(dfs, ignore_index=True)
+        df = get_featured_ranked_df(df)
+    print(f"Shape of the final dataframe is {df.shape}")
+
     df = df.sort_values(by=["social_signals_rank"], ascending=False)
-    output_path = f"s3://social-signals-dev-data/youtube/year={year}/month={month}/day={day}/time={time}/combined.csv"
-    print(f"Writing output to {output_path}")
+    write_df(df, partition_path, name=COMBINED_NAME)
 
-    df.to_csv(output_path, index=False)
+    save_counter_state(pd.concat(snapshots, ignore_index=True))
 
 
 def main():
@@ -64,6 +116,7 @@ def main():
     time = given_date.strftime("%H%M%S")
 
     get_combined_data(year, month, day, time)
+    write_run_report(get_partition_path(year, month, day, time), task="combined")
     print(
         f"Finished getting combined data for year {year}, month {month}, day={day}, and time={time}"
     )
@@ -0,0 +1,68 @@
+import os
+from datetime import datetime
+
+import pandas as pd
+from entry_get_video_category_data import get_video_category_data
+from inference_cache import sync_inference_cache
+from metrics import write_run_report
+from storage import get_partition_path
+
+
+def get_video_categories_data(year, month, day, time, video_category_ids):
+    """
+    Gets the data of many video categories in one process, sharing the YouTube
+    client and the inference cache. A failing category doesn't stop the others;
+    the ids of the failed ones are returned.
+    """
+    failed_video_category_ids = []
+    for i, video_category_id in enumerate(video_category_ids):
+        print(f"Processing video category {i + 1} out of {len(video_category_ids)}")
+        try:
+            get_video_category_data(year, month, day, time, video_category_id)
+        except Exception as e:
+            print(f"Couldn't get data for {video_category_id} due to exception\n{e}")
+            failed_video_category_ids.append(video_category_id)
+
+    return failed_video_category_ids
+
+
+def main():
+    print("Getting Youtube video categories data...")
+
+    execution_date_str = pd.to_datetime(str(os.environ["execution_date"])).strftime(
+        "%Y-%m-%d-%H-%M-%S"
+    )
+    given_date = datetime.strptime(execution_date_str, "%Y-%m-%d-%H-%M-%S")
+    year = given_date.strftime("%Y")
+    month = given_date.strftime("%m")
+    day = given_date.strftime("%d")
+    time = given_date.strftime("%H%M%S")
+
+    config = eval(os.environ["config"])
+    video_categories = [
+        str(video_category) for video_category in config["video_categories"]
+    ]
+    shard = config.get("shard", 0)
+
+    failed_video_categories = get_video_categories_data(
+        year, month, day, time, video_categories
+    )
+    sync_inference_cache()
+    write_run_report(
+        get_partition_path(year, month, day, time),
+        task=f"video_categories_shard_{shard}",
+    )
+
+    # Fails the task so that it is retried; done categories reuse their enrichment
+    if failed_video_categories:
+        raise RuntimeError(
+            f"Couldn't get data for video categories {failed_video_categories}"
+        )
+
+    print(
+        f"Finished getting Youtube data of {len(video_categories)} video categories for year {year}, month {month}, day={day}, and time={time}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,52 @@
 import os
+from contextlib import closing
 from datetime import datetime
 
 import pandas as pd
-from constants import VIDEO_LIMIT
-from youtube import get_video_data, get_most_popular_videos
+from constants import COUNT_COLUMNS, INFERENCE_BATCH_SIZE, VIDEO_LIMIT
+from enrichment_state import load_enrichment_state, save_enrichment_state
+from inference import get_batches
+from inference_cache import sync_inference_cache
+from metrics import timed, write_run_report
+from storage import get_partition_path, write_df
+from youtube import get_most_popular_videos, get_videos_data
 
+
+@timed("get_video_category_data")
 def get_video_category_data(year, month, day, time, video_category_id):
     print(f"Video category is {video_category_id}")
 
-    most_popular_videos = get_most_popular_videos(video_category_id=video_category_id)
+    enrichment_state = load_enrichment_state(video_category_id)
 
+    # Chart pages are only fetched while more videos are needed; closing the
+    # generator saves the pages walked so far
+    most_popular_videos = get_most_popular_videos(video_category_id=video_category_id)
     results = []
-    for i, video in enumerate(most_popular_videos):
-        print(f"Getting data for submission no. {i}")
-        video_data = get_video_data(video=video)
-        if video_data:
-            results.append(video_data)
-        if len(results) == VIDEO_LIMIT:
-            break
-   
+    with closing(most_popular_videos):
+        batches = get_batches(most_popular_videos, INFERENCE_BATCH_SIZE)
+        for i, batch in enumerate(batches):
+            print(f"Getting data for video batch no. {i}")
+            videos_data = get_videos_data(
+                videos=batch, enrichment_state=enrichment_state
+            )
+            results.extend(videos_data)
+            if len(results) >= VIDEO_LIMIT:
+                results = results[:VIDEO_LIMIT]
+                break
+
+    save_enrichment_state(video_category_id, enrichment_state)
+
     df = pd.DataFrame(results)
     print(f"Shape of the final dataframe is {df.shape}")
 
     if df.empty:
-        print("DF is emplty, won't be writing to CSV file...")
+        print("DF is emplty, won't be writing to output file...")
     else:
-        output_path = f"s3://social-signals-dev-data/youtube/year={year}/month={month}/day={day}/time={time}/{video_category_id}.csv"
-        print(f"Writing output to {output_path}")
-        df.to_csv(output_path, index=False)
+        # The API returns the statistics as strings
+        df[COUNT_COLUMNS] = df[COUNT_COLUMNS].apply(pd.to_numeric)
+
+        partition_path = get_partition_path(year, month, day, time)
+        write_df(df, partition_path, name=str(video_category_id))
 
 
 def main():
@@ -46,6 +65,11 @@ def main():
     video_category = str(config["video_category"])
 
     get_video_category_data(year, month, day, time, video_category)
+    sync_inference_cache()
+    write_run_report(
+        get_partition_path(year, month, day, time),
+        task=f"video_category_{video_category}",
+    )
     print(
         f"Finished getting Youtube video category data for year {year}, month {month}, day={day}, and time={time}"
     )
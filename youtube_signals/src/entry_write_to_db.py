@@ -1,53 +1,117 @@
 import os
+from collections import defaultdict, deque
 from datetime import datetime
 
 import pandas as pd
-from constants import COMMENT_LIMIT
-from sqlalchemy import create_engine
-from youtube import process_video_data
-
-from common_tools.common_constants import (
-    CATEGORIES,
-    NONE_FILLER,
-    SCHEMA,
-    SUB_CATEGORIES,
-    TABLE_NAME,
+from constants import COMMENT_LIMIT, COMMENT_PREFETCH_SIZE, SOURCE_PREFIX
+from db_writer import is_partition_written, write_rows_to_db
+from inference_cache import sync_inference_cache
+from metrics import timed, write_run_report
+from storage import COMBINED_NAME, get_object_path, get_partition_path, read_df
+from summarizer import (
+    get_summary_pool,
+    get_summary_result,
+    print_summary_stats,
+    submit_summary,
 )
-from common_tools.db import get_engine
+from youtube import get_videos_comments, process_video_data
 
-CONNECTION = create_engine(get_engine(), pool_pre_ping=True)
+from common_tools.common_constants import CATEGORIES, NONE_FILLER, SUB_CATEGORIES
+
+
+def get_category_index(df):
+    """
+    Buckets the rows of df by (category, sub_category) in a single pass. df is
+    sorted by social_signals_rank, so every bucket is ranked as well.
+    """
+    category_index = defaultdict(list)
+    for row in df.to_dict("records"):
+        for category in CATEGORIES:
+            if row[category] != NONE_FILLER:
+                category_index[(category, row["sub_category"])].append(row)
+
+    return category_index
+
+
+def get_candidates(category_index, category, sub_category, video_ids):
+    for row in category_index.get((category, sub_category), []):
+        video_id = row["video_id"]
+        if video_id in video_ids:
+            print(f"Found already video id {video_id}; skipping...")
+            continue
+        yield row
 
 
 def filter_and_write_to_db(
-    year, month, day, time, df, video_ids, category, sub_category, top_n=3
+    year,
+    month,
+    day,
+    time,
+    category_index,
+    video_ids,
+    rows,
+    videos_comments,
+    summary_pool,
+    category,
+    sub_category,
+    top_n=3,
 ):
     print(f"Processing category {category} and sub-category {sub_category}")
 
-    df_category = df[
-        (df[category] != NONE_FILLER) & (df["sub_category"] == sub_category)
+    bucket = category_index.get((category, sub_category), [])
+    print(f"Number of candidates in the bucket is {len(bucket)}")
+
+    # Comments for the next few candidates are fetched together in one batch
+    candidate_ids = [
+        row["video_id"] for row in bucket if row["video_id"] not in video_ids
     ]
-    print(f"Shape of the df is {df_category.shape}")
 
+    # While the oldest candidate is being summarized in the pool, the next ones are
+    # fetched and inferred; never more than needed to reach top_n are in flight
+    candidates = get_candidates(category_index, category, sub_category, video_ids)
+    pending = deque()
     count = 0
-    for _, row in df_category.iterrows():
-        video_id = row["video_id"]
-        if video_id in video_ids:
-            print(f"Found already video id {video_id}; skipping...")
-            continue
+    while count < top_n:
+        while count + len(pending) < top_n:
+            row = next(candidates, None)
+            if row is None:
+                break
+
+            video_id = row["video_id"]
+            if video_id not in videos_comments:
+                position = candidate_ids.index(video_id)
+                prefetch_ids = [
+                    candidate_id
+                    for candidate_id in candidate_ids[position:]
+                    if candidate_id not in videos_comments
+                ][:COMMENT_PREFETCH_SIZE]
+                videos_comments.update(get_videos_comments(prefetch_ids))
+
+            video_data = process_video_data(
+                video_id=video_id,
+                video_title=row["video_title"],
+                comment_limit=COMMENT_LIMIT,
+                top_level_comments=videos_comments[video_id],
+                summarize=False,
+            )
+            comments = video_data.pop("comments")
+            future = submit_summary(summary_pool, comments)
+            pending.append((row, video_data, future))
+
+        if not pending:
+            break
 
+        row, video_data, future = pending.popleft()
+        video_id = row["video_id"]
         video_title = row["video_title"]
-        video_data = process_video_data(
-            video_id=video_id,
-            video_title=video_title,
-            comment_limit=COMMENT_LIMIT,
-        )
 
-        comments_summary = video_data["comments_summary"]
+        comments_summary = get_summary_result(future)
+        video_data["comments_summary"] = comments_summary
         if len(comments_summary) < 5:
             print(f"Didn't find summary {video_id}; skipping...")
             continue
 
-        video_ids.append(video_id)
+        video_ids.add(video_id)
 
         video_data["year"] = year
         video_data["month"] = month
@@ -56,48 +120,57 @@ def filter_and_write_to_db(
         video_data["title"] = video_title
         video_data["social_signals_rank"] = row["social_signals_rank"]
 
-        video_data["source"] = f"https://www.youtube.com/watch?v={video_id}"
+        video_data["source"] = f"{SOURCE_PREFIX}{video_id}"
 
         video_data["category"] = category
         video_data["sub_category"] = sub_category
         video_data["tags"] = row[category]
 
-        db_df = pd.DataFrame(data=[video_data])
-        print(f"Writing item {count + 1} out of {top_n} to the DB")
-
-        db_df.to_sql(
-            name=TABLE_NAME,
-            con=CONNECTION,
-            schema=SCHEMA,
-            if_exists="append",
-            index=False,
-            method="multi",
-        )
+        rows.append(video_data)
+        print(f"Accepted item {count + 1} out of {top_n} for the DB")
 
         count += 1
-        if count == top_n:
-            break
 
 
+@timed("get_data_and_write_to_db")
 def get_data_and_write_to_db(year, month, day, time):
-    input_path = f"s3://social-signals-dev-data/youtube/year={year}/month={month}/day={day}/time={time}/combined.csv"
-    df = pd.read_csv(input_path)
-    df = df.sort_values(by=["social_signals_rank"], ascending=False)
+    if is_partition_written(year, month, day, time, source_prefix=SOURCE_PREFIX):
+        print("Rows for this run are already in the DB; skipping...")
+        return
+
+    # Combined data is already sorted by social_signals_rank
+    partition_path = get_partition_path(year, month, day, time)
+    input_path = get_object_path(partition_path, COMBINED_NAME)
+    columns = [
+        "video_id",
+        "video_title",
+        "sub_category",
+        "social_signals_rank",
+    ] + list(CATEGORIES)
+    df = read_df(input_path, columns=columns)
     print(f"Shape of the combined df is {df.shape}")
 
-    video_ids = []
-    for category in CATEGORIES:
-        for sub_category in SUB_CATEGORIES:
-            filter_and_write_to_db(
-                year,
-                month,
-                day,
-                time,
-                df,
-                video_ids,
-                category=category,
-                sub_category=sub_category,
-            )
+    category_index = get_category_index(df)
+    video_ids, videos_comments, rows = set(), {}, []
+    with get_summary_pool() as summary_pool:
+        for category in CATEGORIES:
+            for sub_category in SUB_CATEGORIES:
+                filter_and_write_to_db(
+                    year,
+                    month,
+                    day,
+                    time,
+                    category_index,
+                    video_ids,
+                    rows,
+                    videos_comments,
+                    summary_pool,
+                    category=category,
+                    sub_category=sub_category,
+                )
+    print_summary_stats()
+
+    write_rows_to_db(rows)
 
 
 def main():
@@ -113,6 +186,8 @@ def main():
     time = given_date.strftime("%H%M%S")
 
     get_data_and_write_to_db(year, month, day, time)
+    sync_inference_cache(compact=True)
+    write_run_report(get_partition_path(year, month, day, time), task="write_to_db")
     print(
         f"Finished writing Youtube Signals to DB for year {year}, month {month}, day={day}, and time={time}"
     )
@@ -0,0 +1,207 @@
+import importlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+
+from constants import INFERENCE_BATCH_SIZE, INFERENCE_WORKERS
+from inference_cache import get_cached_results, set_cached_results
+from metrics import increment, record
+
+from common_tools.common_constants import CLASSIFICATION_THRESHOLD
+
+_SCHEDULER_LOCK = threading.Lock()
+_SCHEDULER = None
+
+
+def get_batches(items, batch_size):
+    # Items can be a lazy iterator, which is only consumed one batch at a time
+    items = iter(items)
+    batch = list(islice(items, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(items, batch_size))
+
+
+def get_inference_function(model_name):
+    # The SageMaker SDK is only imported once a text isn't found in the cache
+    return getattr(
+        importlib.import_module("common_tools.sagemaker_inference"), model_name
+    )
+
+
+def get_timed_inference(inference_function, text):
+    # Failed predictions come back as error payloads rather than exceptions
+    start = time.perf_counter()
+    error = True
+    try:
+        result = inference_function(text)
+        error = not isinstance(result, (list, dict))
+    finally:
+        record(inference_function.__name__, time.perf_counter() - start, error=error)
+
+    return result
+
+
+class InferenceScheduler:
+    """
+    Shares the inference requests of all the threads of a process, e.g. submission
+    batches or sources processed concurrently. A text is sent as soon as it is
+    submitted, unless the same text is already in flight; up to workers requests
+    are in flight. The endpoints take one text per request, so waiting for more
+    texts wouldn't save any request.
+    """
+
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        # Futures of the texts sent and not cached yet, keyed by model and text
+        self.in_flight = {}
+
+    def submit(self, model_name, texts):
+        """
+        Returns a future per text. Texts found in the inference cache are resolved
+        right away, and texts already in flight share their future.
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        cached_results = get_cached_results(model_name, unique_texts)
+
+        futures = {}
+        for text, result in cached_results.items():
+            futures[text] = Future()
+            futures[text].set_result(result)
+
+        batch = {}
+        with self.lock:
+            in_flight = self.in_flight.setdefault(model_name, {})
+            for text in unique_texts:
+                if text in futures:
+                    continue
+                future = in_flight.get(text)
+                if future is None:
+                    future = Future()
+                    batch[text] = future
+                futures[text] = future
+            in_flight.update(batch)
+
+        if batch:
+            self.send_batch(model_name, batch)
+
+        return [futures[text] for text in texts]
+
+    def send_batch(self, model_name, batch):
+        increment(f"inference_scheduler.{model_name}.batches")
+        increment(f"inference_scheduler.{model_name}.texts", len(batch))
+
+        batch_results = {}
+        pending_requests = [len(batch)]
+
+        def on_request_done(request, text, future):
+            exception = request.exception()
+            if exception is None:
+                future.set_result(request.result())
+            else:
+                future.set_exception(exception)
+
+            with self.lock:
+                if exception is None:
+                    batch_results[text] = request.result()
+                pending_requests[0] -= 1
+                if pending_requests[0]:
+                    return
+
+            # Cached in one write per batch; until then, its texts share its futures
+            set_cached_results(model_name, batch_results)
+            with self.lock:
+                for text in batch:
+                    self.in_flight[model_name].pop(text, None)
+
+        try:
+            inference_function = get_inference_function(model_name)
+        except Exception as e:
+            with self.lock:
+                for text in batch:
+                    self.in_flight[model_name].pop(text, None)
+            for future in batch.values():
+                future.set_exception(e)
+            return
+
+        for text, future in batch.items():
+            request = self.executor.submit(
+                get_timed_inference, inference_function, text
+            )
+            request.add_done_callback(
+                lambda request, text=text, future=future: on_request_done(
+                    request, text, future
+                )
+            )
+
+
+def get_inference_scheduler():
+    global _SCHEDULER
+
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = InferenceScheduler(workers=INFERENCE_WORKERS)
+
+    return _SCHEDULER
+
+
+def run_batched_inference(model_name, texts):
+    """
+    Sends texts to the model_name function of sagemaker_inference through the
+    process-wide scheduler, and waits for their results. Texts already in the
+    inference cache and duplicate texts are not sent again; results are returned
+    in the order of texts.
+    """
+    futures = get_inference_scheduler().submit(model_name, texts)
+    return [future.result() for future in futures]
+
+
+def get_ner_batch(texts):
+    return run_batched_inference("get_ner", texts)
+
+
+def get_categories_batch(texts):
+    return run_batched_inference("get_categories", texts)
+
+
+def get_emotion_batch(texts):
+    return run_batched_inference("get_emotion", texts)
+
+
+def get_comments_emotion(comments, comment_limit, batch_size=INFERENCE_BATCH_SIZE):
+    """
+    Classifies the emotion of comments in batches of at least batch_size until
+    comment_limit usable comments are found. Neutral comments and comments below
+    the classification threshold are dropped; comments that couldn't be classified
+    are kept without an emotion.
+    Returns the usable comments and the counter of their emotions.
+    """
+    comments_emotion_counter, usable_comments = {}, []
+    for batch in get_batches(comments, max(batch_size, comment_limit)):
+        comments_emotion = get_emotion_batch(batch)
+        for comment, comment_emotion in zip(batch, comments_emotion):
+            if isinstance(comment_emotion, list):
+                if comment_emotion:
+                    comment_emotion = comment_emotion[0]
+                    comment_emotion_prediction = comment_emotion["label"]
+
+                    # Neutral is abundant and not interesting
+                    if comment_emotion_prediction == "neutral":
+                        continue
+
+                    comment_emotion_score = comment_emotion["score"]
+                    comment_emotion_score = round(comment_emotion_score, 2)
+                    if comment_emotion_score < CLASSIFICATION_THRESHOLD:
+                        continue
+
+                    comments_emotion_counter[comment_emotion_prediction] = (
+                        comments_emotion_counter.get(comment_emotion_prediction, 0) + 1
+                    )
+
+            usable_comments.append(comment)
+            if len(usable_comments) == comment_limit:
+                return usable_comments, comments_emotion_counter
+
+    return usable_comments, comments_emotion_counter
@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+
+import fsspec
+from constants import (
+    INFERENCE_CACHE_LOCATION,
+    INFERENCE_CACHE_MAX_ENTRIES,
+    INFERENCE_CACHE_PATH,
+    INFERENCE_CACHE_TTL_DAYS,
+)
+from metrics import increment
+
+CACHE_STATS = {"hits": 0, "misses": 0}
+
+# INFERENCE_CACHE_LOCATION holds the compacted cache and a delta object per task
+COMPACTED_NAME = "compacted"
+CACHE_FORMAT = "sqlite"
+
+# Keys looked up or added by this process, uploaded as its delta
+_USED_KEYS = set()
+
+_CACHE_LOCK = threading.Lock()
+_CACHE_CONNECTION = None
+
+
+def get_cache_key(model_name, text):
+    # Whitespace and unicode forms don't change the prediction
+    normalized_text = unicodedata.normalize("NFC", " ".join(text.split()))
+    text_hash = hashlib.sha256(normalized_text.encode("utf-8")).hexdigest()
+    return f"{model_name}:{text_hash}"
+
+
+def create_cache_table(connection, schema="main"):
+    connection.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.inference_cache (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            used_at REAL NOT NULL
+        )
+        """
+    )
+
+
+def evict_inference_cache(connection):
+    """
+    Drops entries older than INFERENCE_CACHE_TTL_DAYS, and then the least recently
+    used entries above INFERENCE_CACHE_MAX_ENTRIES.
+    """
+    expired_at = time.time() - INFERENCE_CACHE_TTL_DAYS * 24 * 60 * 60
+    connection.execute(
+        "DELETE FROM inference_cache WHERE created_at < ?", (expired_at,)
+    )
+    connection.execute(
+        """
+        DELETE FROM inference_cache WHERE key IN (
+            SELECT key FROM inference_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?
+        )
+        """,
+        (INFERENCE_CACHE_MAX_ENTRIES,),
+    )
+    connection.commit()
+
+
+def list_cache_objects(fs, fs_path):
+    """
+    Returns the paths of the compacted cache, if any, and of the deltas that
+    weren't compacted yet.
+    """
+    paths = fs.glob(f"{fs_path}/*.{CACHE_FORMAT}")
+    compacted_file_name = f"{COMPACTED_NAME}.{CACHE_FORMAT}"
+
+    compacted_paths, delta_paths = [], []
+    for path in sorted(paths):
+        if path.rsplit("/", 1)[-1] == compacted_file_name:
+            compacted_paths.append(path)
+        else:
+            delta_paths.append(path)
+
+    return compacted_paths, delta_paths
+
+
+def merge_cache_objects(connection, fs, paths):
+    """
+    Merges the cache objects at paths into connection. An entry found in many of
+    them is kept once, with its latest use.
+    """
+    download_dir = f"{INFERENCE_CACHE_PATH}.objects"
+    try:
+        os.makedirs(download_dir, exist_ok=True)
+        fs.get(paths, f"{download_dir}/")
+        for path in paths:
+            download_path = os.path.join(download_dir, path.rsplit("/", 1)[-1])
+            connection.execute("ATTACH DATABASE ? AS object", (download_path,))
+            try:
+                create_cache_table(connection, schema="object")
+                connection.execute(
+                    """
+                    INSERT INTO main.inference_cache
+                    SELECT * FROM object.inference_cache WHERE true
+                    ON CONFLICT(key) DO UPDATE
+                    SET used_at = max(used_at, excluded.used_at)
+                    """
+                )
+                connection.commit()
+            finally:
+                connection.execute("DETACH DATABASE object")
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+
+def download_inference_cache(connection):
+    fs, fs_path = fsspec.core.url_to_fs(INFERENCE_CACHE_LOCATION)
+    try:
+        compacted_paths, delta_paths = list_cache_objects(fs, fs_path)
+        if compacted_paths or delta_paths:
+            merge_cache_objects(connection, fs, compacted_paths + delta_paths)
+        print(
+            f"Downloaded {len(compacted_paths)} compacted and {len(delta_paths)} "
+            f"delta inference cache object(s) from {INFERENCE_CACHE_LOCATION}"
+        )
+    except Exception as e:
+        print(f"Couldn't download inference cache due to exception\n{e}")
+
+
+def get_inference_cache():
+    global _CACHE_CONNECTION
+
+    if _CACHE_CONNECTION is None:
+        is_downloaded = os.path.exists(INFERENCE_CACHE_PATH)
+        connection = sqlite3.connect(INFERENCE_CACHE_PATH, check_same_thread=False)
+        create_cache_table(connection)
+        if not is_downloaded:
+            download_inference_cache(connection)
+        evict_inference_cache(connection)
+        _CACHE_CONNECTION = connection
+
+    return _CACHE_CONNECTION
+
+
+def get_cached_results(model_name, texts):
+    """
+    Returns the cached results of model_name for texts as a dict keyed by text.
+    """
+    keys = {get_cache_key(model_name, text): text for text in texts}
+
+    cached_results = {}
+    with _CACHE_LOCK:
+        connection = get_inference_cache()
+        for key, text in keys.items():
+            row = connection.execute(
+                "SELECT result FROM inference_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                continue
+            cached_results[text] = json.loads(row[0])
+
+        now = time.time()
+        connection.executemany(
+            "UPDATE inference_cache SET used_at = ? WHERE key = ?",
+            [(now, get_cache_key(model_name, text)) for text in cached_results],
+        )
+        connection.commit()
+        _USED_KEYS.update(get_cache_key(model_name, text) for text in cached_results)
+
+        CACHE_STATS["hits"] += len(cached_results)
+        CACHE_STATS["misses"] += len(keys) - len(cached_results)
+
+    increment(f"inference_cache.{model_name}.hits", len(cached_results))
+    increment(f"inference_cache.{model_name}.misses", len(keys) - len(cached_results))
+
+    return cached_results
+
+
+def set_cached_results(model_name, results):
+    """
+    Caches results, a dict keyed by text. Only successful predictions are cached
+    so that failed requests are retried in the next run.
+    """
+    now = time.time()
+    rows = [
+        (get_cache_key(model_name, text), json.dumps(result), now, now)
+        for text, result in results.items()
+        if isinstance(result, (list, dict))
+    ]
+
+    with _CACHE_LOCK:
+        connection = get_inference_cache()
+        connection.executemany(
+            "INSERT OR REPLACE INTO inference_cache VALUES (?, ?, ?, ?)", rows
+        )
+        connection.commit()
+        _USED_KEYS.update(key for key, _, _, _ in rows)
+
+
+def upload_inference_cache_delta(connection, fs, fs_path):
+    # Named uniquely, so that parallel tasks never overwrite each other's entries
+    delta_path = f"{INFERENCE_CACHE_PATH}.delta"
+    if os.path.exists(delta_path):
+        os.remove(delta_path)
+
+    connection.execute("ATTACH DATABASE ? AS delta", (delta_path,))
+    try:
+        create_cache_table(connection, schema="delta")
+        connection.executemany(
+            "INSERT OR REPLACE INTO delta.inference_cache "
+            "SELECT * FROM main.inference_cache WHERE key = ?",
+            [(key,) for key in _USED_KEYS],
+        )
+        connection.commit()
+    finally:
+        connection.execute("DETACH DATABASE delta")
+
+    delta_name = f"{time.time():.0f}-{uuid.uuid4().hex}"
+    try:
+        fs.put(delta_path, f"{fs_path}/{delta_name}.{CACHE_FORMAT}")
+    finally:
+        os.remove(delta_path)
+    print(
+        f"Uploaded {len(_USED_KEYS)} inference cache entries to "
+        f"{INFERENCE_CACHE_LOCATION}/{delta_name}.{CACHE_FORMAT}"
+    )
+
+
+def compact_inference_cache(connection, fs, fs_path):
+    # The entries of this process and the deltas merged on load are already local
+    _, delta_paths = list_cache_objects(fs, fs_path)
+    if delta_paths:
+        merge_cache_objects(connection, fs, delta_paths)
+
+    evict_inference_cache(connection)
+    fs.put(INFERENCE_CACHE_PATH, f"{fs_path}/{COMPACTED_NAME}.{CACHE_FORMAT}")
+    if delta_paths:
+        fs.rm(delta_paths)
+    print(
+        f"Compacted {len(delta_paths)} inference cache delta(s) into "
+        f"{INFERENCE_CACHE_LOCATION}/{COMPACTED_NAME}.{CACHE_FORMAT}"
+    )
+
+
+def sync_inference_cache(compact=False):
+    """
+    Uploads the entries this process looked up or added as a delta of its own, so
+    that tasks running in parallel don't drop each other's entries. With compact,
+    the deltas are merged into the compacted cache and deleted instead; only the
+    write to DB task does it, once per run and after the fetch tasks, so that two
+    compactions never race.
+    """
+    print(
+        f"Inference cache hits: {CACHE_STATS['hits']}, misses: {CACHE_STATS['misses']}"
+    )
+    if _CACHE_CONNECTION is None:
+        return
+
+    fs, fs_path = fsspec.core.url_to_fs(INFERENCE_CACHE_LOCATION)
+    with _CACHE_LOCK:
+        connection = _CACHE_CONNECTION
+        try:
+            fs.makedirs(fs_path, exist_ok=True)
+            if compact:
+                compact_inference_cache(connection, fs, fs_path)
+            elif _USED_KEYS:
+                upload_inference_cache_delta(connection, fs, fs_path)
+        except Exception as e:
+            print(f"Couldn't upload inference cache due to exception\n{e}")
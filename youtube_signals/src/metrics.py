@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+import fsspec
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+# Latest latencies kept per stage for the percentiles
+LATENCY_SAMPLE_SIZE = 10000
+
+_METRICS_LOCK = threading.Lock()
+_METRICS = {}
+_COUNTERS = {}
+
+
+def record(name, seconds, error=False):
+    with _METRICS_LOCK:
+        metric = _METRICS.get(name)
+        if metric is None:
+            metric = {
+                "calls": 0,
+                "errors": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "histogram": [0] * (len(LATENCY_BUCKETS) + 1),
+                "samples": deque(maxlen=LATENCY_SAMPLE_SIZE),
+            }
+            _METRICS[name] = metric
+
+        metric["calls"] += 1
+        metric["errors"] += int(error)
+        metric["total_seconds"] += seconds
+        metric["max_seconds"] = max(metric["max_seconds"], seconds)
+        metric["samples"].append(seconds)
+
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        metric["histogram"][bucket] += 1
+
+
+def increment(name, value=1):
+    with _METRICS_LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + value
+
+
+@contextmanager
+def timed_block(name):
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        record(name, time.perf_counter() - start, error=error)
+
+
+def timed(name):
+    """
+    Decorator recording the call count, latency and errors of a function as name.
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed_block(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_percentile(samples, percentile):
+    # Nearest-rank percentile of sorted samples
+    index = max(0, min(len(samples) - 1, round(percentile / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+def get_run_report(task):
+    bucket_names = [f"le_{bucket}" for bucket in LATENCY_BUCKETS] + ["le_inf"]
+
+    with _METRICS_LOCK:
+        metrics = {}
+        for name, metric in sorted(_METRICS.items()):
+            samples = sorted(metric["samples"])
+            metrics[name] = {
+                "calls": metric["calls"],
+                "errors": metric["errors"],
+                "total_seconds": round(metric["total_seconds"], 4),
+                "mean_seconds": round(metric["total_seconds"] / metric["calls"], 4),
+                "p50_seconds": round(get_percentile(samples, 50), 4),
+                "p95_seconds": round(get_percentile(samples, 95), 4),
+                "max_seconds": round(metric["max_seconds"], 4),
+                "histogram": dict(zip(bucket_names, metric["histogram"])),
+            }
+        counters = dict(sorted(_COUNTERS.items()))
+
+    return {
+        "task": task,
+        "generated_at": datetime.utcnow().isoformat(),
+        "metrics": metrics,
+        "counters": counters,
+    }
+
+
+def write_run_report(partition_path, task):
+    report_path = f"{partition_path}/_metrics/{task}.json"
+    print(f"Writing run report to {report_path}")
+
+    try:
+        fs, fs_path = fsspec.core.url_to_fs(report_path)
+        fs.makedirs(fs_path.rsplit("/", 1)[0], exist_ok=True)
+        with fs.open(fs_path, "w") as f:
+            json.dump(get_run_report(task), f, indent=2)
+    except Exception as e:
+        print(f"Couldn't write run report due to exception\n{e}")
@@ -0,0 +1,212 @@
+import fcntl
+import json
+import os
+import threading
+import time
+
+from metrics import increment
+
+# Applied atomically on the Redis side, with the clock of the Redis server
+REDIS_TAKE_SCRIPT = """
+redis.replicate_commands()
+local capacity = tonumber(ARGV[1])
+local rate_per_second = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate_per_second)
+local wait_seconds = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait_seconds = (cost - tokens) / rate_per_second
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens))
+redis.call("HSET", KEYS[1], "updated_at", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate_per_second) + 1)
+return tostring(wait_seconds)
+"""
+
+# An unreachable Redis fails a call after this long rather than hanging it
+REDIS_TIMEOUT_SECONDS = 1
+
+# Calls use a bucket of their process for this long after a backend error
+BACKEND_RETRY_SECONDS = 30
+
+
+def take_tokens(state, cost, rate_per_second, capacity, now):
+    """
+    Refills the bucket in state up to now and takes cost tokens from it if there
+    are enough. Returns the new state and how long to wait before there are enough
+    tokens, 0 when they were taken.
+    """
+    if state is None:
+        state = {"tokens": capacity, "updated_at": now}
+
+    tokens = min(
+        capacity,
+        state["tokens"] + max(0.0, now - state["updated_at"]) * rate_per_second,
+    )
+    if tokens >= cost:
+        return {"tokens": tokens - cost, "updated_at": now}, 0.0
+
+    return {"tokens": tokens, "updated_at": now}, (cost - tokens) / rate_per_second
+
+
+class MemoryBackend:
+    # Buckets shared by the threads of a process
+    def __init__(self):
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, cost, rate_per_second, capacity):
+        with self.lock:
+            self.states[key], wait_seconds = take_tokens(
+                self.states.get(key), cost, rate_per_second, capacity, time.monotonic()
+            )
+
+        return wait_seconds
+
+
+class FileBackend:
+    # Buckets shared by the processes of a host, one locked file per bucket
+    def __init__(self, directory):
+        self.directory = directory
+
+    def take(self, key, cost, rate_per_second, capacity):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}.json")
+
+        with open(path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content else None
+                state, wait_seconds = take_tokens(
+                    state, cost, rate_per_second, capacity, time.time()
+                )
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        return wait_seconds
+
+
+class RedisBackend:
+    # Buckets shared by all the tasks, in any Redis-compatible store
+    def __init__(self, url):
+        self.url = url
+        self.script = None
+        self.lock = threading.Lock()
+
+    def get_script(self):
+        with self.lock:
+            if self.script is None:
+                try:
+                    import redis
+                except ImportError:
+                    raise ImportError(
+                        "The redis package is needed for a redis:// rate limiter URL"
+                    )
+                client = redis.Redis.from_url(
+                    self.url,
+                    socket_connect_timeout=REDIS_TIMEOUT_SECONDS,
+                    socket_timeout=REDIS_TIMEOUT_SECONDS,
+                )
+                self.script = client.register_script(REDIS_TAKE_SCRIPT)
+
+        return self.script
+
+    def take(self, key, cost, rate_per_second, capacity):
+        wait_seconds = self.get_script()(
+            keys=[f"rate_limiter:{key}"], args=[capacity, rate_per_second, cost]
+        )
+        return float(wait_seconds)
+
+
+def get_rate_limiter_backend(url):
+    """
+    url: Can be one of: "memory://", "file:///path/to/directory" or
+    "redis://host:port/db", or "rediss://" for TLS
+    """
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith("file://"):
+        return FileBackend(url[len("file://") :])
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url)
+
+    raise ValueError(f"Unsupported rate limiter URL {url}")
+
+
+class RateLimiter:
+    """
+    Token bucket: tokens are refilled at rate_per_minute up to capacity, and every
+    call costs tokens, e.g. its API units. The bucket lives in backend under key,
+    so that it can be shared by the threads of a process or by many processes.
+    While backend fails, e.g. Redis is unreachable, calls are limited by a bucket
+    of their process instead, and backend is tried again every
+    BACKEND_RETRY_SECONDS.
+    """
+
+    def __init__(self, rate_per_minute, capacity, backend=None, key="default"):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.key = key
+        self.fallback_backend = MemoryBackend()
+        self.backend_retry_at = None
+
+    def take(self, cost):
+        backend_retry_at = self.backend_retry_at
+        if backend_retry_at is None or time.monotonic() >= backend_retry_at:
+            try:
+                wait_seconds = self.backend.take(
+                    self.key, cost, self.rate_per_second, self.capacity
+                )
+            except Exception as e:
+                increment(f"rate_limiter.{self.key}.backend_errors")
+                if backend_retry_at is None:
+                    print(
+                        f"Couldn't take {self.key} tokens from the shared rate limiter "
+                        f"due to exception\n{e}\nLimiting this process on its own..."
+                    )
+                self.backend_retry_at = time.monotonic() + BACKEND_RETRY_SECONDS
+            else:
+                if backend_retry_at is not None:
+                    print(f"Using the shared {self.key} rate limiter again")
+                    self.backend_retry_at = None
+                return wait_seconds
+
+        return self.fallback_backend.take(
+            self.key, cost, self.rate_per_second, self.capacity
+        )
+
+    def acquire(self, cost=1, timeout=None):
+        """
+        Takes cost tokens, waiting for them up to timeout seconds, or as long as
+        needed when timeout is None. Returns False without taking any when they
+        wouldn't be available in time, so that the caller can shed the call.
+        """
+        if cost > self.capacity:
+            raise ValueError(f"Cost {cost} is above the capacity {self.capacity}")
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait_seconds = self.take(cost)
+            if wait_seconds <= 0:
+                return True
+
+            if deadline is not None and time.monotonic() + wait_seconds > deadline:
+                increment(f"rate_limiter.{self.key}.shed")
+                return False
+
+            increment(f"rate_limiter.{self.key}.waits")
+            time.sleep(wait_seconds)
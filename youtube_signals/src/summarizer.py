@@ -0,0 +1,59 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import SUMMARY_WORKERS
+from metrics import record
+
+from common_tools.common_constants import NONE_FILLER
+
+SUMMARY_STATS = {"jobs": 0, "seconds": 0.0}
+
+
+def get_summary_pool(workers=SUMMARY_WORKERS):
+    # Workers are started by a fork server rather than forked from this process,
+    # whose inference threads may be holding locks at the time
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+    )
+
+
+def get_timed_summary(comments):
+    # Runs in a worker process, which is the only one that needs sumy and nltk
+    from common_tools.sumy_summary import get_sumy_summary
+
+    start = time.perf_counter()
+    summary = get_sumy_summary(comments)
+    return summary, time.perf_counter() - start
+
+
+def submit_summary(summary_pool, comments):
+    if not comments:
+        return
+
+    return summary_pool.submit(get_timed_summary, comments)
+
+
+def get_summary_result(future):
+    if future is None:
+        return NONE_FILLER
+
+    try:
+        summary, seconds = future.result()
+    except Exception:
+        record("get_sumy_summary", 0.0, error=True)
+        raise
+
+    record("get_sumy_summary", seconds)
+    print(f"Summarized comments in {seconds:.2f} seconds")
+    SUMMARY_STATS["jobs"] += 1
+    SUMMARY_STATS["seconds"] += seconds
+
+    return summary
+
+
+def print_summary_stats():
+    print(
+        f"Ran {SUMMARY_STATS['jobs']} summary jobs "
+        f"taking {SUMMARY_STATS['seconds']:.2f} seconds in total"
+    )
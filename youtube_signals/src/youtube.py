@@ -1,138 +1,322 @@
+import json
 import os
+import threading
 from datetime import datetime
 
-from googleapiclient.discovery import build
+import fsspec
+from constants import (
+    DATA_LOCATION,
+    RATE_LIMITER_URL,
+    VIDEO_MAX_PAGES,
+    VIDEO_PAGE_SIZE,
+    YOUTUBE_QUOTA_MAX_WAIT_SECONDS,
+    YOUTUBE_QUOTA_UNITS_BURST,
+    YOUTUBE_QUOTA_UNITS_PER_DAY,
+    YOUTUBE_UNIT_COSTS,
+)
+from enrichment import SourceAdapter, get_items_data, process_item_data
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.errors import HttpError
+from metrics import increment, timed
+from rate_limiter import RateLimiter, get_rate_limiter_backend
+
+# Bundled at image build time so that building the client needs no network fetch
+DISCOVERY_DOCUMENT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "discovery", "youtube.v3.json"
+)
+
+# Google APIs accept at most 50 requests per HTTP batch
+MAX_BATCH_REQUESTS = 50
+
+# Partial responses with only what get_video_data reads
+MOST_POPULAR_FIELDS = (
+    "etag,nextPageToken,"
+    "items(id,snippet(title,publishedAt),statistics(viewCount,likeCount,commentCount))"
+)
+
+# Pages of the most popular charts from the last run, reused while unchanged
+CHART_STATE_LOCATION = f"{DATA_LOCATION}/_state/charts"
+
+# Shared by all the tasks using the same API key, depending on the backend
+YOUTUBE_RATE_LIMITER = RateLimiter(
+    rate_per_minute=YOUTUBE_QUOTA_UNITS_PER_DAY / (24 * 60),
+    capacity=YOUTUBE_QUOTA_UNITS_BURST,
+    backend=get_rate_limiter_backend(RATE_LIMITER_URL),
+    key="youtube",
+)
+
+_YOUTUBE_LOCK = threading.Lock()
+_YOUTUBE = None
 
-from common_tools.common_constants import CLASSIFICATION_THRESHOLD, NONE_FILLER
-from common_tools.sagemaker_inference import get_categories, get_emotion, get_ner
-from common_tools.sumy_summary import get_sumy_summary
 
-config = eval(os.environ["config"])
-GOOGLE_API_KEY = config["google_api_key"]
+def get_youtube():
+    """
+    Returns the process-wide YouTube client, built once from the bundled discovery
+    document when it is available.
+    """
+    global _YOUTUBE
+
+    with _YOUTUBE_LOCK:
+        if _YOUTUBE is None:
+            # The key is only read once a client is needed
+            google_api_key = eval(os.environ["config"])["google_api_key"]
+            if os.path.exists(DISCOVERY_DOCUMENT_PATH):
+                with open(DISCOVERY_DOCUMENT_PATH) as f:
+                    discovery_document = f.read()
+                _YOUTUBE = build_from_document(
+                    discovery_document, developerKey=google_api_key
+                )
+            else:
+                print("Didn't find bundled discovery document; fetching it...")
+                _YOUTUBE = build(
+                    "youtube", "v3", developerKey=google_api_key, cache_discovery=False
+                )
 
+    return _YOUTUBE
 
-def get_youtube():
-    youtube = build("youtube", "v3", developerKey=GOOGLE_API_KEY)
-    return youtube
 
+def acquire_quota(method, calls=1, wait=True):
+    """
+    Takes the quota units of calls calls of method, waiting for them up to
+    YOUTUBE_QUOTA_MAX_WAIT_SECONDS unless wait is False. Returns whether they were
+    taken; the calls should be skipped otherwise.
+    """
+    timeout = YOUTUBE_QUOTA_MAX_WAIT_SECONDS if wait else 0
+    if YOUTUBE_RATE_LIMITER.acquire(YOUTUBE_UNIT_COSTS[method] * calls, timeout):
+        return True
 
-def get_most_popular_videos(video_category_id, max_results=50):
-    youtube = get_youtube()
+    print(f"Not enough YouTube quota for {calls} {method} call(s); skipping...")
+    increment("youtube.shed")
+    return False
 
-    request = youtube.videos().list(
-        part="snippet, statistics",
-        chart="mostPopular",
-        regionCode="US",
-        videoCategoryId=video_category_id,
-        maxResults=max_results,
-    )
 
-    videos = []
+def load_chart_state(video_category_id):
+    """
+    Returns the pages of the most popular chart of a category from the last run,
+    each with its page token, ETag and response.
+    """
+    state_path = f"{CHART_STATE_LOCATION}/{video_category_id}.json"
+    try:
+        fs, fs_path = fsspec.core.url_to_fs(state_path)
+        with fs.open(fs_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"Didn't find chart state at {state_path}")
+    except Exception as e:
+        print(f"Couldn't read chart state due to exception\n{e}")
+
+    return []
+
+
+def save_chart_state(video_category_id, pages):
+    if not pages:
+        return
+
+    state_path = f"{CHART_STATE_LOCATION}/{video_category_id}.json"
+    try:
+        fs, fs_path = fsspec.core.url_to_fs(state_path)
+        fs.makedirs(fs_path.rsplit("/", 1)[0], exist_ok=True)
+        with fs.open(fs_path, "w") as f:
+            json.dump(pages, f)
+    except Exception as e:
+        print(f"Couldn't write chart state due to exception\n{e}")
+
+
+def get_most_popular_request(
+    youtube, video_category_id, max_results, page_token=None, etag=None
+):
+    params = {
+        "part": "snippet,statistics",
+        "fields": MOST_POPULAR_FIELDS,
+        "chart": "mostPopular",
+        "regionCode": "US",
+        "videoCategoryId": video_category_id,
+        "maxResults": max_results,
+    }
+    if page_token is not None:
+        params["pageToken"] = page_token
+
+    request = youtube.videos().list(**params)
+    # The API answers 304 without a body when the page hasn't changed
+    if etag is not None:
+        request.headers["If-None-Match"] = etag
+
+    return request
+
+
+def is_not_modified(exception):
+    return isinstance(exception, HttpError) and exception.resp.status == 304
+
+
+@timed("get_most_popular_page")
+def get_most_popular_page(
+    youtube, video_category_id, max_results, page_token, cached_page
+):
+    """
+    Returns a page of the most popular chart, or None when it couldn't be fetched.
+    A page cached by an earlier run is requested conditionally on its ETag, and
+    reused when it hasn't changed.
+    """
+    if not acquire_quota("videos.list"):
+        return
 
+    etag = cached_page["etag"] if cached_page is not None else None
+    request = get_most_popular_request(
+        youtube, video_category_id, max_results, page_token=page_token, etag=etag
+    )
     try:
         response = request.execute()
     except Exception as e:
+        if is_not_modified(e):
+            increment("youtube.chart_pages.not_modified")
+            return cached_page["response"]
+
         print(f"Couldn't get popular videos due to exception {e}")
-        return videos
+        increment("youtube.errors")
+        return
 
-    for video in response["items"]:
-        videos.append(video)
+    increment("youtube.chart_pages.fetched")
+    return response
 
-    return videos
 
+def get_most_popular_videos(
+    video_category_id, max_results=VIDEO_PAGE_SIZE, max_pages=VIDEO_MAX_PAGES
+):
+    """
+    Yields the videos of the most popular chart of a category, from up to
+    max_pages pages of max_results videos. Only the fields read by get_video_data
+    are requested.
 
-def get_video_comments(video_id, max_results=100):
+    Pages are fetched lazily, one after another as a page token only comes with
+    the previous page, so that later pages cost nothing when the caller has
+    enough videos. Pages walked this run are saved for the next one once the
+    caller is done, including when it stops early.
+    """
     youtube = get_youtube()
 
-    request = youtube.commentThreads().list(
+    cached_pages = {
+        cached_page["page_token"]: cached_page
+        for cached_page in load_chart_state(video_category_id)[:max_pages]
+    }
+
+    pages = []
+    try:
+        page_token = None
+        for _ in range(max_pages):
+            response = get_most_popular_page(
+                youtube,
+                video_category_id,
+                max_results,
+                page_token,
+                cached_pages.pop(page_token, None),
+            )
+            if response is None:
+                break
+
+            pages.append(
+                {
+                    "page_token": page_token,
+                    "etag": response.get("etag"),
+                    "response": response,
+                }
+            )
+            yield from response.get("items", [])
+
+            page_token = response.get("nextPageToken")
+            if page_token is None:
+                break
+    finally:
+        # Pages that weren't needed this run are kept for a later one
+        save_chart_state(video_category_id, pages + list(cached_pages.values()))
+
+
+def get_comments_from_response(response):
+    comments = []
+    for item in response["items"]:
+        comment = item["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
+        comments.append(comment)
+
+    return comments
+
+
+def get_comment_threads_request(youtube, video_id, max_results):
+    return youtube.commentThreads().list(
         part="snippet", videoId=video_id, order="relevance", maxResults=max_results
     )
 
+
+@timed("get_video_comments")
+def get_video_comments(video_id, max_results=100):
+    youtube = get_youtube()
+
+    request = get_comment_threads_request(youtube, video_id, max_results)
+
     comments = []
 
+    # Comments are shed first, so that quota is left for the charts
+    if not acquire_quota("commentThreads.list", wait=False):
+        return comments
+
     try:
         response = request.execute()
     except Exception as e:
         print(f"Couldn't get comments due to exception {e}")
+        increment("youtube.errors")
         return comments
 
-    for item in response["items"]:
-        comment = item["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
-        comments.append(comment)
+    return get_comments_from_response(response)
 
-    return comments
-
-
-def get_video_data(video):
-    video_data = {}
-
-    video_data["video_id"] = video["id"]
-
-    video_title = video["snippet"]["title"]
-    video_data["video_title"] = video_title
-    print(f"Video title: {video_title}")
-
-    print("Getting entities for the title...")
-    entities = get_ner(video_title)
-    organization, person, location = [], [], []
-    if isinstance(entities, list):
-        for entity in entities:
-            word = entity["word"]
-            if (
-                entity["entity_group"] == "ORG"
-                and entity["score"] >= CLASSIFICATION_THRESHOLD
-            ):
-                if "#" not in word and len(word) >= 2:
-                    organization.append(entity["word"])
-            if (
-                entity["entity_group"] == "PER"
-                and entity["score"] >= CLASSIFICATION_THRESHOLD
-            ):
-                if "#" not in word and len(word) >= 2:
-                    person.append(entity["word"])
-            if (
-                entity["entity_group"] == "LOC"
-                and entity["score"] >= CLASSIFICATION_THRESHOLD
-            ):
-                if "#" not in word and len(word) >= 2:
-                    location.append(entity["word"])
-
-    if not (organization + person + location):
-        print("Expected entities not found. Quitting...")
-        return
 
-    if organization:
-        video_data["Organization"] = ", ".join(organization)
-    else:
-        video_data["Organization"] = NONE_FILLER
-    if person:
-        video_data["Person"] = ", ".join(person)
-    else:
-        video_data["Person"] = NONE_FILLER
-    if location:
-        video_data["Location"] = ", ".join(location)
-    else:
-        video_data["Location"] = NONE_FILLER
-
-    print("Getting sub-category for the title...")
-    sub_category = get_categories(video_title)
-    if isinstance(sub_category, dict):
-        title_sub_category_label = sub_category["labels"][0]
-        title_sub_category_score = sub_category["scores"][0]
-
-        if title_sub_category_score >= 0.25:
-            video_data["sub_category"] = title_sub_category_label
-        else:
-            video_data["sub_category"] = "Miscellaneous"
-    else:
-        video_data["sub_category"] = "Miscellaneous"
+@timed("get_videos_comments")
+def get_videos_comments(video_ids, max_results=100):
+    """
+    Batched version of get_video_comments: the commentThreads requests for all the
+    videos are sent in HTTP batch requests. Returns comments keyed by video id.
+    """
+    youtube = get_youtube()
+    video_ids = list(dict.fromkeys(video_ids))
+    videos_comments = {video_id: [] for video_id in video_ids}
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            print(
+                f"Couldn't get comments for {request_id} due to exception {exception}"
+            )
+            increment("youtube.errors")
+            return
+        videos_comments[request_id] = get_comments_from_response(response)
+
+    for i in range(0, len(video_ids), MAX_BATCH_REQUESTS):
+        batch_video_ids = video_ids[i : i + MAX_BATCH_REQUESTS]
+        # Every request of a batch costs its own units
+        if not acquire_quota(
+            "commentThreads.list", calls=len(batch_video_ids), wait=False
+        ):
+            continue
+
+        batch = youtube.new_batch_http_request(callback=callback)
+        for video_id in batch_video_ids:
+            request = get_comment_threads_request(youtube, video_id, max_results)
+            batch.add(request, request_id=video_id)
+
+        try:
+            batch.execute()
+        except Exception as e:
+            print(f"Couldn't get comments batch due to exception {e}")
+            increment("youtube.errors")
+
+    return videos_comments
+
+
+def get_video_stats(video):
+    video_stats = {}
 
     today = datetime.today()
     published_date = video["snippet"]["publishedAt"]
     published_date = datetime.strptime(published_date, "%Y-%m-%dT%H:%M:%SZ")
     published_date.strftime("%Y-%m-%d")
     total_days = today - published_date
-    video_data["total_days"] = int(total_days.days)
+    video_stats["total_days"] = int(total_days.days)
 
     # Find alternate way to handle this
     video_statistics = video["statistics"]
@@ -140,80 +324,64 @@ def get_video_data(video):
         video_view_count = video_statistics["viewCount"]
     else:
         video_view_count = 0.0
-    video_data["video_view_count"] = video_view_count
+    video_stats["video_view_count"] = video_view_count
 
     if "likeCount" in video_statistics:
         video_like_count = video_statistics["likeCount"]
     else:
         video_like_count = 0.0
-    video_data["video_like_count"] = video_like_count
+    video_stats["video_like_count"] = video_like_count
 
     if "commentCount" in video_statistics:
         video_comment_count = video_statistics["commentCount"]
     else:
         video_comment_count = 0.0
-    video_data["video_comment_count"] = video_comment_count
+    video_stats["video_comment_count"] = video_comment_count
 
-    return video_data
+    return video_stats
 
 
-def process_video_data(video_id, video_title, comment_limit):
-    video_data = {}
+class YouTubeAdapter(SourceAdapter):
+    id_column = "video_id"
+    title_column = "video_title"
 
-    print("Getting emotion for the title...")
-    title_emotion = get_emotion(video_title)
-    if isinstance(title_emotion, list):
-        if title_emotion:
-            title_emotion = title_emotion[0]
-            title_emotion_prediction = title_emotion["label"]
-            title_emotion_score = title_emotion["score"]
-            if title_emotion_score >= CLASSIFICATION_THRESHOLD:
-                video_data["title_emotion"] = title_emotion_prediction
-            else:
-                video_data["title_emotion"] = "neutral"
-
-    print("Going over comments...")
-    comment_count = 0
-    top_level_comments = get_video_comments(video_id=video_id)
-    comments_emotion_counter, comments = {}, []
-    for top_level_comment in top_level_comments:
-        comment_emotion = get_emotion(top_level_comment)
-
-        if isinstance(comment_emotion, list):
-            if comment_emotion:
-                comment_emotion = comment_emotion[0]
-                comment_emotion_prediction = comment_emotion["label"]
-
-                # Neutral is abundant and not interesting
-                if comment_emotion_prediction == "neutral":
-                    continue
-
-                comment_emotion_score = comment_emotion["score"]
-                comment_emotion_score = round(comment_emotion_score, 2)
-                if comment_emotion_score < CLASSIFICATION_THRESHOLD:
-                    continue
-
-                comments_emotion_counter[comment_emotion_prediction] = (
-                    comments_emotion_counter.get(comment_emotion_prediction, 0) + 1
-                )
+    def get_item_id(self, video):
+        return video["id"]
 
-        comments.append(top_level_comment)
-        comment_count += 1
-        if comment_count == comment_limit:
-            break
-    print(f"Found {len(comments)} comments")
+    def get_item_title(self, video):
+        return video["snippet"]["title"]
 
-    if comments_emotion_counter:
-        video_data["comments_emotion"] = max(
-            comments_emotion_counter, key=comments_emotion_counter.get
-        )
-    else:
-        video_data["comments_emotion"] = "neutral"
+    def get_item_stats(self, video):
+        return get_video_stats(video)
 
-    if comments:
-        summary = get_sumy_summary(comments)
-        video_data["comments_summary"] = summary
-    else:
-        video_data["comments_summary"] = NONE_FILLER
+    def get_item_comments(self, video_id, comment_limit):
+        return get_video_comments(video_id=video_id)
+
+
+@timed("get_videos_data")
+def get_videos_data(videos, enrichment_state=None):
+    """
+    Batched version of get_video_data, see enrichment.get_items_data.
+    """
+    return get_items_data(YouTubeAdapter(), videos, enrichment_state=enrichment_state)
 
-    return video_data
+
+def get_video_data(video):
+    videos_data = get_videos_data([video])
+    if videos_data:
+        return videos_data[0]
+
+
+@timed("process_video_data")
+def process_video_data(
+    video_id, video_title, comment_limit, top_level_comments=None, summarize=True
+):
+    # Comments may have been fetched in a batch already
+    return process_item_data(
+        YouTubeAdapter(),
+        video_id,
+        video_title,
+        comment_limit,
+        comments=top_level_comments,
+        summarize=summarize,
+    )